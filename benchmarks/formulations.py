@@ -0,0 +1,248 @@
+"""MIP formulations of the tutorial, written as functions of the instance data
+(the union of data.parsing.offline and data.parsing.online) and of the
+compiled contract rules r (see regular_scheduling.contracts.regular_rules).
+
+If the data has an "arrays" entry (data.parsing.online_arrays of the same
+instance and version), the cover requirements and the costs of the objective
+are read from it: the preference costs then only have a term per request.
+"""
+from functools import partial
+from time import time
+
+from regular_scheduling.mip_regular import Regular_Model
+
+
+def demand(data):
+    """ Return the cover requirements {(t,s): d}."""
+    if "arrays" not in data:
+        return {(t,s):data["d"][t][s] for t in range(1,data["T"]+1) for s in data["Sigma"].difference({data["o"]})}
+    arrays = data["arrays"]
+    return {(t+1,s):int(arrays["d"][t,j]) for t in range(arrays["T"]) for j,s in enumerate(arrays["shifts"])}
+
+def cover_costs(mip,data,z_minus,z_plus):
+    """ Return the undercover and overcover costs of the slacks {(t,s): var}."""
+    if "arrays" not in data:
+        u,v = data["u"],data["v"]
+        return mip.sum(z_minus[t,s]*u[t][s]+z_plus[t,s]*v[t][s] for t,s in z_minus.keys())
+    return data["arrays"]["u"]*mip.sum_vars(z_minus.values())+data["arrays"]["v"]*mip.sum_vars(z_plus.values())
+
+def preference_costs(mip,data,x):
+    """ Return the costs of the requests of the employees (x = {e: {(t,s): var}}): the weight of a request on if it
+    is not granted and of a request off if it is."""
+    if "arrays" not in data:
+        p,q = data["p"],data["q"]
+        return mip.sum(p[e][t][s]*(1-x[e][t,s]) + q[e][t][s]*x[e][t,s] for e in x.keys() for t,s in x[e].keys())
+    arrays = data["arrays"]
+    employees,shifts = arrays["employees"],arrays["shifts"]
+    variables = lambda r: [x[employees[e]][t+1,shifts[s]] for e,t,s in zip(r["employee"],r["day"],r["shift"])]
+    on,off = arrays["request_on"],arrays["request_off"]
+    return int(on["weight"].sum())-mip.scal_prod(variables(on),on["weight"].tolist())+mip.scal_prod(variables(off),off["weight"].tolist())
+
+
+def ca_mip(data,r):
+    """ Compact assignment formulation (CA-MIP) of the tutorial."""
+    G,E,T,W,Sigma,o,O,F,tau = (data[k] for k in ("G","E","T","W","Sigma","o","O","F","tau"))
+    gamma_max,gamma_min,delta_min,nu_max,tau_max,rho_max = (data[k] for k in ("gamma_max","gamma_min","delta_min","nu_max","tau_max","rho_max"))
+
+    t0 = time()
+    mip = Regular_Model()
+
+    # variables
+    x = {}
+    for g in G:
+        for e in E[g]:
+            x[e] = mip.binary_var_dict(((t,s) for t in range(1,T+1) for s in Sigma.difference({o})),name = "employee "+e)
+    z_minus = mip.continuous_var_dict(((t,s) for t in range(1,T+1) for s in Sigma.difference({o})),lb = 0)
+    z_plus = mip.continuous_var_dict(((t,s) for t in range(1,T+1) for s in Sigma.difference({o})),lb = 0)
+    y = mip.binary_var_dict((e,w) for e in set().union(*E.values()) for w in range(1,W+1))
+
+    # linear constraints
+    mip.add_constraints((mip.sum(x[e][t,s] for s in Sigma.difference({o})) <= 1 for e in x.keys() for t in range(1,T+1)),names = "assignments")
+    mip.add_constraints((x[e][t,s] == 0 for e in x.keys() for t in O[e] for s in Sigma.difference({o})),names = "days-off") 
+    mip.add_constraints((x[e][t,s1]+x[e][t+1,s2] <= 1 for g in G for e in E[g] for t in range(1,T) for s in Sigma.difference({o}) for s1 in Sigma.difference({o}) for s2 in F[g][s1]),names = "rule 1")
+    mip.add_constraints((mip.sum(x[e][t2,s] for t2 in range(t1,t1+gamma_max[g]+1) for s in Sigma.difference({o})) <= gamma_max[g] for g in G for e in E[g] for t1 in range(1,T-gamma_max[g]+1)),names = "rule 2")
+    mip.add_constraints((mip.sum(x[e][t1,s] for s in Sigma.difference({o})) + (t2 - mip.sum(x[e][t3,s] for t3 in range(t1+1,t1+t2+1) for s in Sigma.difference({o}))) + mip.sum(x[e][t1+t2+1,s] for s in Sigma.difference({o})) >= 1 for g in G for e in E[g] for t2 in range(1,gamma_min[g]) for t1 in range(1,T-t2)),names = "rule 3")
+    mip.add_constraints(((1-mip.sum(x[e][t1,s] for s in Sigma.difference({o}))) + mip.sum(x[e][t3,s] for t3 in range(t1+1,t1+t2+1) for s in Sigma.difference({o})) + (1-mip.sum(x[e][t1+t2+1,s] for s in Sigma.difference({o}))) >= 1 for g in G for e in E[g] for t2 in range(1,delta_min[g]) for t1 in range(1,T-t2)),names = "rule 4")
+    mip.add_constraints((mip.sum(x[e][t,s] for s in Sigma.difference({o})) <= y[e,w] for e in x.keys() for w in range(1,W+1) for t in [7*w-1,7*w]),names = "rule 5")
+    mip.add_constraints((mip.sum(y[e,w] for w in range(w1,w1+2)) <= nu_max[g] for g in G for e in E[g] for w1 in range(1,W)),names = "rule 5'")
+    mip.add_constraints((mip.sum(tau[s]*x[e][t,s] for t in range(7*w-6,7*w+1) for s in Sigma.difference({o})) <= tau_max[g] for g in G for e in E[g] for w in range(1,W+1)),names = "rule 6")
+    mip.add_constraints((mip.sum(x[e][t2,s] for t2 in range(t1,t1+7)) <= rho_max[g][s] for g in G for e in E[g] for s in Sigma.difference({o}) for t1 in range(1,T-5)),names = "rule 7")
+
+    # cover requirements
+    mip.add_constraints(mip.sum(x[e_or_g][t,s] for e_or_g in x.keys()) + z_minus[t,s] - z_plus[t,s] == d_ts for (t,s),d_ts in demand(data).items())
+
+    # objective function
+    mip.minimize(preference_costs(mip,data,x) + cover_costs(mip,data,z_minus,z_plus))
+
+    mip.building_time = time()-t0
+    return mip
+
+def p_rb_mip_prime(data,r):
+    """ Personalized formulation with regular rules 1 to 4 only (P-RB-MIP')."""
+    G,E,T,W,Sigma,o,O,tau = (data[k] for k in ("G","E","T","W","Sigma","o","O","tau"))
+    nu_max,tau_max,rho_max = (data[k] for k in ("nu_max","tau_max","rho_max"))
+
+    t0 = time()
+    mip = Regular_Model()
+
+    # variables
+    x = {}
+    for g in G:
+        for e in E[g]:
+            x[e] = mip.binary_var_dict(((t,s) for t in range(1,T+1) for s in Sigma.difference({o})),name = "employee "+e)
+    z_minus = mip.continuous_var_dict(((t,s) for t in range(1,T+1) for s in Sigma.difference({o})),lb = 0)
+    z_plus = mip.continuous_var_dict(((t,s) for t in range(1,T+1) for s in Sigma.difference({o})),lb = 0)
+    y = mip.binary_var_dict((e,w) for e in set().union(*E.values()) for w in range(1,W+1))
+
+    # regular constraints
+    for g in G:
+        for e in E[g]:
+            mip.add_regular_constraint(x[e],1,[{o} if t in O[e] else Sigma for t in range(1,T+1)],r[g][1],r[g][2],r[g][3],r[g][4],ctname="flow "+e)
+
+    # linear constraints
+    mip.add_constraints((mip.sum(x[e][t,s] for s in Sigma.difference({o})) <= y[e,w] for e in x.keys() for w in range(1,W+1) for t in [7*w-1,7*w]),names = "rule 5")
+    mip.add_constraints((mip.sum(y[e,w] for w in range(w1,w1+2)) <= nu_max[g] for g in G for e in E[g] for w1 in range(1,W)),names = "rule 5'")
+    mip.add_constraints((mip.sum(tau[s]*x[e][t,s] for t in range(7*w-6,7*w+1) for s in Sigma.difference({o})) <= tau_max[g] for g in G for e in E[g] for w in range(1,W+1)),names = "rule 6")
+    mip.add_constraints((mip.sum(x[e][t2,s] for t2 in range(t1,t1+7)) <= rho_max[g][s] for g in G for e in E[g] for s in Sigma.difference({o}) for t1 in range(1,T-5)),names = "rule 7")
+  
+    # cover requirements
+    mip.add_constraints(mip.sum(x[e_or_g][t,s] for e_or_g in x.keys()) + z_minus[t,s] - z_plus[t,s] == d_ts for (t,s),d_ts in demand(data).items())
+
+    # objective function
+    mip.minimize(preference_costs(mip,data,x) + cover_costs(mip,data,z_minus,z_plus))
+
+    mip.building_time = time()-t0
+    return mip
+
+def p_rb_mip(data,r,classes = False,presolve = False):
+    """ Personalized regular based formulation (P-RB-MIP), with the options classes and presolve of its regular
+    constraints (see Regular_Model.add_regular_constraint)."""
+    G,E,T,W,Sigma,o,O = (data[k] for k in ("G","E","T","W","Sigma","o","O"))
+
+    t0 = time()
+    mip = Regular_Model()
+
+    # variables
+    x = {}
+    for g in G:
+        for e in E[g]:
+            x[e] = mip.binary_var_dict(((t,s) for t in range(1,T+1) for s in Sigma.difference({o})),name = "employee "+e)
+    z_minus = mip.continuous_var_dict(((t,s) for t in range(1,T+1) for s in Sigma.difference({o})),lb = 0)
+    z_plus = mip.continuous_var_dict(((t,s) for t in range(1,T+1) for s in Sigma.difference({o})),lb = 0)
+
+    # regular constraints
+    for g in G:
+        for e in E[g]:
+            mip.add_regular_constraint(x[e],1,[{o} if t in O[e] else Sigma for t in range(1,T+1)],*r[g].values(),ctname="flow "+e,classes=classes,presolve=presolve)
+ 
+    # cover requirements
+    mip.add_constraints(mip.sum(x[e_or_g][t,s] for e_or_g in x.keys()) + z_minus[t,s] - z_plus[t,s] == d_ts for (t,s),d_ts in demand(data).items())
+
+    # objective function
+    mip.minimize(preference_costs(mip,data,x) + cover_costs(mip,data,z_minus,z_plus))
+
+    mip.building_time = time()-t0
+    return mip
+
+def p_rb_cg(data,r):
+    """ Personalized regular based formulation solved by column generation (P-RB-CG): the master of P-RB-MIP, whose
+    schedules are priced by generate_columns before solving."""
+    G,E,T,Sigma,o,O = (data[k] for k in ("G","E","T","Sigma","o","O"))
+
+    t0 = time()
+    mip = Regular_Model()
+
+    # variables
+    x = {}
+    for g in G:
+        for e in E[g]:
+            x[e] = mip.binary_var_dict(((t,s) for t in range(1,T+1) for s in Sigma.difference({o})),name = "employee "+e)
+    z_minus = mip.continuous_var_dict(((t,s) for t in range(1,T+1) for s in Sigma.difference({o})),lb = 0)
+    z_plus = mip.continuous_var_dict(((t,s) for t in range(1,T+1) for s in Sigma.difference({o})),lb = 0)
+
+    # regular constraints (master part)
+    for g in G:
+        for e in E[g]:
+            mip.add_regular_columns(x[e],1,[{o} if t in O[e] else Sigma for t in range(1,T+1)],*r[g].values(),ctname="flow "+e)
+
+    # cover requirements
+    mip.add_constraints(mip.sum(x[e_or_g][t,s] for e_or_g in x.keys()) + z_minus[t,s] - z_plus[t,s] == d_ts for (t,s),d_ts in demand(data).items())
+
+    # objective function
+    mip.minimize(preference_costs(mip,data,x) + cover_costs(mip,data,z_minus,z_plus))
+
+    mip.building_time = time()-t0
+    return mip
+
+def a_rb_mip(data,r,classes = False,presolve = False):
+    """ Anonymous regular based formulation (A-RB-MIP), with the options classes and presolve of its regular
+    constraints."""
+    G,E,T,Sigma,o = (data[k] for k in ("G","E","T","Sigma","o"))
+
+    t0 = time()
+    mip = Regular_Model()
+
+    # variables
+    x = {}
+    for g in G:
+        x[g] = mip.integer_var_dict(((t,s) for t in range(1,T+1) for s in Sigma.difference({o})),lb = 0, ub = len(E[g]), name = "contract "+g)
+    z_minus = mip.continuous_var_dict(((t,s) for t in range(1,T+1) for s in Sigma.difference({o})),lb = 0)
+    z_plus = mip.continuous_var_dict(((t,s) for t in range(1,T+1) for s in Sigma.difference({o})),lb = 0)
+
+    # regular constraints
+    for g in G:
+        mip.add_regular_constraint(x[g],len(E[g]),T,*r[g].values(),ctname="flow "+g,classes=classes,presolve=presolve)
+ 
+    # cover requirements
+    mip.add_constraints(mip.sum(x[e_or_g][t,s] for e_or_g in x.keys()) + z_minus[t,s] - z_plus[t,s] == d_ts for (t,s),d_ts in demand(data).items())
+
+    # objective function
+    mip.minimize(cover_costs(mip,data,z_minus,z_plus))
+
+    mip.building_time = time()-t0
+    return mip
+
+def g_rb_mip(data,r,classes = False,presolve = False):
+    """ Personalized regular based formulation in which the interchangeable employees (same contract, days-off
+    and preferences) share one flow (G-RB-MIP), with the options classes and presolve of its regular constraints. It
+    is P-RB-MIP if no two employees are interchangeable."""
+    G,E,T,Sigma,o,O = (data[k] for k in ("G","E","T","Sigma","o","O"))
+    p,q = (data[k] for k in ("p","q"))
+
+    t0 = time()
+    mip = Regular_Model()
+
+    # variables and regular constraints
+    keys = [(t,s) for t in range(1,T+1) for s in Sigma.difference({o})]
+    preferences = lambda e: tuple((t,s,p[e][t][s],q[e][t][s]) for t,s in keys if p[e][t][s] or q[e][t][s])
+    units = {e:([{o} if t in O[e] else Sigma for t in range(1,T+1)],tuple(r[g].values()),(g,preferences(e))) for g in G for e in E[g]}
+    groups = mip.add_grouped_regular_constraints(units,keys,classes=classes,presolve=presolve)
+    z_minus = mip.continuous_var_dict(keys,lb = 0)
+    z_plus = mip.continuous_var_dict(keys,lb = 0)
+
+    # cover requirements
+    mip.add_constraints(mip.sum(x[t,s] for _,x in groups) + z_minus[t,s] - z_plus[t,s] == d_ts for (t,s),d_ts in demand(data).items())
+
+    # objective function
+    mip.minimize(mip.sum(p[e[0]][t][s]*(len(e)-x[t,s]) + q[e[0]][t][s]*x[t,s] for e,x in groups for t,s in keys) + cover_costs(mip,data,z_minus,z_plus))
+
+    mip.building_time = time()-t0
+    return mip
+
+def regular_start(mip,data):
+    """ Add the greedy MIP start of a regular based formulation (see Regular_Model.add_regular_start): the flows of the
+    employees (or groups, with the preferences of their first member) are priced by their preferences q - p."""
+    T,Sigma,o,d,u,v,p,q = (data[k] for k in ("T","Sigma","o","d","u","v","p","q"))
+    keys = [(t,s) for t in range(1,T+1) for s in Sigma.difference({o})]
+    preferences = {}
+    for handle in mip.regular_constraints:
+        e = handle.ctname[len("flow "):].split("+")[0]
+        if e in p:
+            preferences[handle.ctname] = {(t,s):q[e][t][s]-p[e][t][s] for t,s in keys}
+    return mip.add_regular_start({(t,s):d[t][s] for t,s in keys},{(t,s):u[t][s] for t,s in keys},{(t,s):v[t][s] for t,s in keys},preferences)
+
+formulations = {"CA-MIP":ca_mip,"P-RB-MIP'":p_rb_mip_prime,"P-RB-MIP":p_rb_mip,"P-RB-CG":p_rb_cg,"A-RB-MIP":a_rb_mip,"G-RB-MIP":g_rb_mip,
+                "P-RB-MIP classes":partial(p_rb_mip,classes = True),"P-RB-MIP presolve":partial(p_rb_mip,presolve = True),
+                "P-RB-MIP classes presolve":partial(p_rb_mip,classes = True,presolve = True),
+                "A-RB-MIP classes presolve":partial(a_rb_mip,classes = True,presolve = True),
+                "G-RB-MIP classes presolve":partial(g_rb_mip,classes = True,presolve = True)}
@@ -0,0 +1,266 @@
+"""Benchmark of the compilation and modeling stages on the instances of ./data.
+
+For each instance, times the parsing, each of the 7 rule constructions (over
+all the contracts), the intersection of the rules of each contract, the
+unfolding of the automaton of each employee and the construction of the
+models of benchmarks.formulations, and records the sizes of the automata and
+of the models. Results are written as JSON and compared against
+a baseline: the run fails if a time exceeds its baseline by more than the
+tolerance or if a size grows. Solving is optional (it requires CPLEX).
+
+Usage: python -m benchmarks.instances [--instances 1 2 3] [--models P-RB-MIP ...] [--output results.json]
+       [--baseline benchmarks/baseline.json] [--update-baseline]
+       [--tolerance 1.0] [--memory] [--solve 60] [--warm-start] [--processes 4] [--store rules/]
+
+--update-baseline merges the results into the baseline stage by stage, so the
+large instances can be recorded in several runs on some of the models each.
+
+With --processes, the rules and intersections are also built by
+parallel_rules in a pool of processes (stage "parallel"). With --store, they
+are loaded from (and, on the first run, compiled into) a Rule_Store (stage
+"store").
+
+The stage "timed unfold" builds the rules with the periodic rules 5 and 6 as
+Timed_DFA (without day-of-the-week counter) and unfolds their product for each
+employee directly; its sizes are the ones of stage "unfold".
+
+The parsing is also timed through the binary snapshots of data.parsing, once
+after removing them (stage "parsing cold") and once from them ("parsing warm").
+The formulations read the cover requirements and the costs from the columnar
+data.parsing.online_arrays (see benchmarks.formulations).
+
+With --warm-start, the regular based models get the greedy MIP start of
+benchmarks.formulations.regular_start before solving. The time to the first
+incumbent and the final relative gap of the solve are recorded.
+
+The models "P-RB-MIP classes", "P-RB-MIP presolve" and "P-RB-MIP classes
+presolve" (and "A-RB-MIP classes presolve", "G-RB-MIP classes presolve") are
+built with the options of add_regular_constraint: their flows have one arc per
+class of shifts with the same transitions in the rules (the "symbol_classes"
+metric of add_regular_constraint counts them), and/or their layered graphs are
+presolved before the constraints are emitted. P-RB-MIP, A-RB-MIP and G-RB-MIP
+are built without them.
+
+The columns of P-RB-CG are generated before solving it (price-and-branch),
+and its solve time includes their generation.
+
+Times measured with --memory are slowed down by tracemalloc and are not
+compared against the baseline.
+"""
+import argparse
+import json
+import os
+import sys
+import tracemalloc
+from contextlib import contextmanager
+from glob import glob
+from time import perf_counter
+
+from docplex.mp.progress import ProgressClock, ProgressListener
+
+from benchmarks.formulations import formulations, regular_start
+from data.parsing import offline, online, online_arrays
+from regular_scheduling.contracts import rules, parallel_rules, contract_rules
+from regular_scheduling.operations import intersection, unfold, unfold_intersection, clear_caches
+from regular_scheduling.store import Rule_Store
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+TIMES = {"time": 0.05, "solve_time": 1.0, "first_incumbent": 1.0, "peak_memory": 2**20}
+IGNORED = {"objective", "columns", "gap"}
+
+
+@contextmanager
+def measure(results, stage, memory = False):
+    """Records the wall time (and the peak of traced memory) of the block in results[stage]."""
+    metrics = results.setdefault(stage, {})
+    if memory:
+        tracemalloc.start()
+    t0 = perf_counter()
+    yield metrics
+    metrics["time"] = round(perf_counter() - t0, 4)
+    if memory:
+        metrics["peak_memory"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+
+class First_Incumbent(ProgressListener):
+    """Records the solve time at which the first incumbent is found."""
+
+    def __init__(self):
+        super().__init__(ProgressClock.Objective)
+        self.time = None
+
+    def notify_start(self):
+        super().notify_start()
+        self.time = None
+
+    def notify_progress(self, progress):
+        if self.time is None and progress.has_incumbent:
+            self.time = round(progress.time, 4)
+
+
+def size(dfas):
+    """Returns the total number of states and transitions of the DFAs."""
+    return {
+        "states": sum(len(dfa["states"]) for dfa in dfas),
+        "transitions": sum(len(dfa["transitions"]) for dfa in dfas),
+    }
+
+
+def benchmark(instance, models = tuple(formulations), memory = False, solve = None, processes = None, store = None,
+              warm_start = False):
+    """Returns the metrics of each stage for one instance."""
+    results = {}
+    with measure(results, "parsing", memory):
+        data = offline(instance)
+        personalized = {**data, **online(instance, "personalized"), "arrays": online_arrays(instance, "personalized")}
+        anonymous = {**data, **online(instance, "anonymous"), "arrays": online_arrays(instance, "anonymous")}
+    G, E, T, Sigma, o, O = (personalized[k] for k in ("G", "E", "T", "Sigma", "o", "O"))
+
+    for path in glob(os.path.join(instance, ".*.pickle")):
+        os.remove(path)
+    for stage in ("parsing cold", "parsing warm"):
+        with measure(results, stage, memory):
+            offline(instance, cache = True)
+            online(instance, "personalized", cache = True)
+            online(instance, "anonymous", cache = True)
+            online_arrays(instance, "personalized", cache = True)
+            online_arrays(instance, "anonymous", cache = True)
+
+    r = {g: {} for g in G}
+    for i, rule in rules.items():
+        with measure(results, f"rule {i}", memory) as metrics:
+            for g in G:
+                r[g][i] = rule(data, g)
+        metrics.update(size([r[g][i] for g in G]))
+
+    with measure(results, "intersection", memory) as metrics:
+        dfas = {g: intersection(*r[g].values()) for g in G}
+    metrics.update(size(dfas.values()))
+
+    if processes:
+        with measure(results, "parallel", memory) as metrics:
+            parallel = parallel_rules(data, processes, intersect = True)[1]
+        metrics.update(size(parallel.values()))
+        del parallel
+
+    if store:
+        Rule_Store(store).populate(data, processes, intersect = True)
+        with measure(results, "store", memory) as metrics:
+            stored = Rule_Store(store).rules(data, intersect = True)[1]
+        metrics.update(size(stored.values()))
+        del stored
+
+    with measure(results, "unfold", memory) as metrics:
+        unfolded = [
+            unfold(dfas[g], [{o} if t in O[e] else Sigma for t in range(1, T + 1)])
+            for g in G for e in E[g]
+        ]
+    metrics.update(size(unfolded))
+    del unfolded
+
+    with measure(results, "timed unfold", memory) as metrics:
+        timed = {g: contract_rules(data, g, timed = True) for g in G}
+        unfolded = [
+            unfold_intersection([{o} if t in O[e] else Sigma for t in range(1, T + 1)], *timed[g].values())
+            for g in G for e in E[g]
+        ]
+    metrics.update(size(unfolded))
+    # the automata of the stages are released before the models are built
+    del dfas, timed, unfolded
+
+    for name in models:
+        clear_caches()
+        with measure(results, name, memory) as metrics:
+            model = formulations[name](anonymous if name.startswith("A-RB-MIP") else personalized, r)
+        metrics["variables"] = model.number_of_variables
+        metrics["constraints"] = model.number_of_constraints
+        if solve is not None:
+            model.parameters.timelimit = solve
+            t0 = perf_counter()
+            columns = model.generate_columns()
+            if warm_start and model.regular_constraints:
+                regular_start(model, anonymous if name.startswith("A-RB-MIP") else personalized)
+            listener = First_Incumbent()
+            model.add_progress_listener(listener)
+            solution = model.solve()
+            metrics["solve_time"] = round(perf_counter() - t0 if columns else model.solve_details.time, 4)
+            # solved before the first progress notification: the incumbent is found within the solve time
+            metrics["first_incumbent"] = listener.time if listener.time is not None or not solution else metrics["solve_time"]
+            metrics["gap"] = model.solve_details.mip_relative_gap if solution else None
+            if columns:
+                metrics["columns"] = columns
+            metrics["objective"] = solution.objective_value if solution else None
+        model.end()
+        # released before the next model is built, not while it is assigned
+        del model
+    return results
+
+
+def compare(results, baseline, tolerance, times = True):
+    """Returns the list of regressions of the results with respect to the baseline
+    (times are skipped if not times, e.g. when they were measured with tracemalloc)."""
+    regressions = []
+    for instance, stages in results.items():
+        for stage, metrics in stages.items():
+            reference = baseline.get(instance, {}).get(stage, {})
+            for key, value in metrics.items():
+                if key in IGNORED or reference.get(key) is None or value is None:
+                    continue
+                if key in TIMES and key != "peak_memory" and not times:
+                    continue
+                if key in TIMES:
+                    limit = reference[key] * (1 + tolerance) + TIMES[key]
+                else:
+                    limit = reference[key]
+                if value > limit:
+                    regressions.append(f"{instance} {stage} {key}: {value} > {limit:.4g} (baseline {reference[key]})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--instances", nargs = "*", type = int)
+    parser.add_argument("--models", nargs = "*", default = list(formulations), choices = list(formulations))
+    parser.add_argument("--output", help = "JSON file in which the results are written")
+    parser.add_argument("--baseline", default = BASELINE)
+    parser.add_argument("--update-baseline", action = "store_true")
+    parser.add_argument("--tolerance", type = float, default = 1.0, help = "allowed relative slowdown")
+    parser.add_argument("--memory", action = "store_true", help = "trace the peak memory (slower)")
+    parser.add_argument("--solve", type = float, help = "solve the models with this time limit (s)")
+    parser.add_argument("--warm-start", action = "store_true", help = "add a greedy MIP start before solving")
+    parser.add_argument("--processes", type = int, help = "also build the rules in a pool of processes")
+    parser.add_argument("--store", help = "also load the rules from this Rule_Store directory")
+    args = parser.parse_args()
+
+    instances = args.instances or sorted(int(path.split("Instance")[-1]) for path in glob("./data/Instance*"))
+    results = {}
+    for i in instances:
+        results[f"Instance{i}"] = stages = benchmark(f"./data/Instance{i}", args.models, args.memory, args.solve, args.processes, args.store,
+                                                      args.warm_start)
+        for stage, metrics in stages.items():
+            print(f"Instance{i:<3} {stage:<13}", " ".join(f"{k}={v}" for k, v in metrics.items()), flush = True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent = 1)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    if args.update_baseline:
+        # merged stage by stage, so that a run on some of the models keeps the baseline of the others
+        for instance, stages in results.items():
+            baseline.setdefault(instance, {}).update(stages)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent = 1, sort_keys = True)
+        return
+    regressions = compare(results, baseline, args.tolerance, not args.memory)
+    for regression in regressions:
+        print("REGRESSION", regression)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Compile time of the knapsack rule (rule 6) on the contracts of the instances.
+
+For each instance and each distinct weekly workload bound tau_max of its
+contracts, times the knapsack automaton bounded from above (as in rule 6), the
+knapsack automaton bounded from both sides (tau_max minus the longest shift,
+tau_max) and the whole rule 6 (the periodic repetition of the first one over
+7 days).
+
+Usage: python -m benchmarks.knapsack [--instances 1 8 12]
+"""
+import argparse
+from glob import glob
+from time import perf_counter
+
+from data.parsing import offline
+from regular_scheduling.contracts import rule_6
+from regular_scheduling.standard_rules import knapsack
+
+
+def timed(build, *args, **kwargs):
+    """Returns the automaton built by build(*args, **kwargs) and its compile time."""
+    t0 = perf_counter()
+    dfa = build(*args, **kwargs)
+    return dfa, perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--instances", nargs = "*", type = int)
+    args = parser.parse_args()
+
+    instances = args.instances or sorted(int(path.split("Instance")[-1]) for path in glob("./data/Instance*"))
+    print(f"{'instance':>8} {'|Sigma|':>7} {'tau_max':>7} {'rule':>9} {'states':>8} {'time (s)':>9}")
+    for i in instances:
+        data = offline(f"./data/Instance{i}")
+        tau = data["tau"]
+        symbols, weights = tuple(tau.keys()), tuple(tau.values())
+        contracts = {}
+        for g in sorted(data["G"]):
+            contracts.setdefault(data["tau_max"][g], g)
+        for tau_max, g in sorted(contracts.items()):
+            builds = {"upper": timed(knapsack, symbols, weights, upper_bound = tau_max),
+                      "bounded": timed(knapsack, symbols, weights, tau_max - max(weights), tau_max),
+                      "rule 6": timed(rule_6, data, g)}
+            for name, (dfa, elapsed) in builds.items():
+                print(f"{i:>8} {len(data['Sigma']):>7} {tau_max:>7} {name:>9} {len(dfa['states']):>8} {elapsed:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
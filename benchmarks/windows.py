@@ -0,0 +1,49 @@
+"""Compile time of the windows operation on the contract alphabets of the instances.
+
+For the first contract of each instance, the bases of rules 1 and 7 of the
+tutorial (forbidden successions and maximum number of each shift) are built
+once, then windows is timed for each period. Larger periods of an alphabet are
+skipped once a compilation exceeds the time limit.
+
+Usage: python -m benchmarks.windows [--instances 1 8 12] [--periods 2 14] [--limit 30]
+"""
+import argparse
+from glob import glob
+from time import perf_counter
+
+from data.parsing import offline
+from regular_scheduling.operations import windows, union, complementation
+from regular_scheduling.standard_rules import pattern, cardinality
+
+
+def bases(data, g):
+    """Returns the automata windowed by rules 1 and 7 for the contract g."""
+    Sigma, o, F, rho_max = data["Sigma"], data["o"], data["F"][g], data["rho_max"][g]
+    rule_1 = union(*[pattern((s, F[s], Sigma.difference({s}.union(F[s]))), [s, F[s]]) for s in Sigma.difference({o})])
+    rule_7 = complementation(cardinality(tuple(rho_max.keys()) + (o,), upper_bounds = tuple(rho_max.values()) + (float("inf"),)))
+    return {"rule 1": rule_1, "rule 7": rule_7}
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--instances", nargs = "*", type = int)
+    parser.add_argument("--periods", nargs = 2, type = int, default = (2, 14))
+    parser.add_argument("--limit", type = float, default = 30.0, help = "time limit (s) per compilation")
+    args = parser.parse_args()
+
+    instances = args.instances or sorted(int(path.split("Instance")[-1]) for path in glob("./data/Instance*"))
+    print(f"{'instance':>8} {'|Sigma|':>7} {'rule':>6} {'period':>6} {'states':>8} {'time (s)':>9}")
+    for i in instances:
+        data = offline(f"./data/Instance{i}")
+        for name, dfa in bases(data, sorted(data["G"])[0]).items():
+            for period in range(args.periods[0], args.periods[1] + 1):
+                t0 = perf_counter()
+                result = windows(dfa, period, 0, 0)
+                elapsed = perf_counter() - t0
+                print(f"{i:>8} {len(data['Sigma']):>7} {name[5:]:>6} {period:>6} {len(result['states']):>8} {elapsed:>9.3f}")
+                if elapsed > args.limit:
+                    break
+
+
+if __name__ == "__main__":
+    main()
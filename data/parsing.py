@@ -1,6 +1,62 @@
 import json
+import os
+import pickle
+import numpy as np
 from collections import defaultdict
-    
+from functools import wraps
+from inspect import getsource, signature
+from hashlib import sha1
+
+SNAPSHOT_FORMAT = 1
+
+def cached(source):
+    # adds a cache keyword to a loader of instance: its result is then read from a binary snapshot
+    # written next to the source file, which is rebuilt when the source (mtime, size and sha1) or
+    # the code of the loader changes
+    def decorator(loader):
+        code = sha1(getsource(loader).encode()).hexdigest()
+        @wraps(loader)
+        def wrapper(instance,*args,cache = False,**kwargs):
+            if not cache:
+                return loader(instance,*args,**kwargs)
+            arguments = signature(loader).bind(instance,*args,**kwargs)
+            arguments.apply_defaults()
+            name = ".".join(["",loader.__name__]+[str(a) for a in arguments.args[1:]]+["pickle"])
+            return snapshot(os.path.join(instance,source),os.path.join(instance,name),lambda: loader(*arguments.args),code)
+        return wrapper
+    return decorator
+
+def snapshot(source,path,build,version = None):
+    # returns build() through the snapshot at path, reused as long as the source file keeps
+    # its mtime and size, or else its content hash (the header then gets the new mtime and size),
+    # and the version of build (e.g. a hash of its code) is the same
+    stat = os.stat(source)
+    signature = (SNAPSHOT_FORMAT,version,stat.st_mtime_ns,stat.st_size)
+    if os.path.exists(path):
+        with open(path,"rb") as f:
+            header = pickle.load(f)
+            if header["signature"] == signature:
+                return pickle.load(f)
+            content = (SNAPSHOT_FORMAT,version,_sha1(source))
+            if header["sha1"] == content:
+                data = pickle.load(f)
+                _write(path,{"signature":signature,"sha1":content},data)
+                return data
+    data = build()
+    _write(path,{"signature":signature,"sha1":(SNAPSHOT_FORMAT,version,_sha1(source))},data)
+    return data
+
+def _write(path,header,data):
+    with open(path+".tmp","wb") as f:
+        pickle.dump(header,f)
+        pickle.dump(data,f,protocol = pickle.HIGHEST_PROTOCOL)
+    os.replace(path+".tmp",path)
+
+def _sha1(path):
+    with open(path,"rb") as f:
+        return sha1(f.read()).hexdigest()
+
+@cached("offline.json")
 def offline(instance):
     data = {}
     with open(instance+"/offline.json") as f:
@@ -20,6 +76,7 @@ def offline(instance):
     data["rho_max"] = {g:{s:contract["max_shifts"].get(s,float("inf")) for s in offline["shifts_length"].keys()} for g,contract in offline["contracts"].items()}
     return data
 
+@cached("online.json")
 def online(instance,version = "personalized"):
     data = {}
     with open(instance+"/online.json") as f:
@@ -48,4 +105,43 @@ def online(instance,version = "personalized"):
         else:
             raise Exception("Version has to be either 'personalized' or 'anonymous'") 
     data["E"] = dict(data["E"])
-    return data
\ No newline at end of file
+    return data
+
+@cached("online.json")
+def online_arrays(instance,version = "personalized"):
+    # columnar version of online: employees, days and shifts are interned to the indices
+    # of data["employees"], range(T) (day t+1) and data["shifts"]; the requests are COO arrays
+    if version not in ("personalized","anonymous"):
+        raise Exception("Version has to be either 'personalized' or 'anonymous'")
+    data = {}
+    with open(instance+"/online.json") as f:
+        online = json.load(f)
+    employees = online["employees"]
+    data["T"] = online["horizon"]
+    data["W"] = data["T"]//7
+    data["employees"] = tuple(employees.keys())
+    data["contracts"] = tuple(sorted({v["contract"] for v in employees.values()}))
+    data["shifts"] = tuple(sorted({s for d in online["demand"] for s in d["required"]}))
+    contract = {g:i for i,g in enumerate(data["contracts"])}
+    shift = {s:i for i,s in enumerate(data["shifts"])}
+    data["contract"] = np.array([contract[v["contract"]] for v in employees.values()],dtype = np.int32)
+    data["d"] = np.zeros((data["T"],len(shift)),dtype = np.int32)
+    for d in online["demand"]:
+        data["d"][d["day"]-1,[shift[s] for s in d["required"]]] = list(d["required"].values())
+    data["u"] = online["costs"]["undercover"]
+    data["v"] = online["costs"]["overcover"]
+    data["days_off"] = np.zeros((len(employees),data["T"]),dtype = bool)
+    for request in ("request_on","request_off"):
+        data[request] = {"employee":[],"day":[],"shift":[],"weight":[]}
+    if version == "personalized":
+        for e,v in enumerate(employees.values()):
+            data["days_off"][e,[t-1 for t in v["days_off"]]] = True
+            for request in ("request_on","request_off"):
+                for r in v[request]:
+                    data[request]["employee"].append(e)
+                    data[request]["day"].append(r["day"]-1)
+                    data[request]["shift"].append(shift[r["shift"]])
+                    data[request]["weight"].append(r["weight"])
+    for request in ("request_on","request_off"):
+        data[request] = {k:np.array(v,dtype = np.int32) for k,v in data[request].items()}
+    return data
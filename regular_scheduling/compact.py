@@ -0,0 +1,401 @@
+from collections import defaultdict
+from hashlib import sha1
+
+import numpy as np
+
+
+class Compact_DFA:
+    """Array-backed DFA.
+
+    States are the integers 0..n-1, symbols are interned to the columns of an
+    int32 transition table (missing transitions are -1) and accepting states
+    are given by a boolean mask. The original state labels can be kept in
+    names so that the conversion to the PySimpleAutomata format is lossless.
+    """
+
+    __slots__ = ("symbols", "table", "initial_state", "accepting", "names")
+
+    def __init__(self, symbols, table, initial_state, accepting, names = None):
+        self.symbols = tuple(symbols)
+        self.table = np.asarray(table, dtype = np.int32).reshape(len(accepting), len(self.symbols))
+        self.initial_state = int(initial_state)
+        self.accepting = np.asarray(accepting, dtype = bool)
+        self.names = names
+
+    @classmethod
+    def from_dict(cls, dfa, symbols = None):
+        """Returns the compact version of a PySimpleAutomata DFA."""
+        if symbols is None:
+            symbols = sorted(dfa["alphabet"], key = repr)
+        code = {s: j for j, s in enumerate(symbols)}
+        transitions = dfa["transitions"]
+        names = {dfa["initial_state"]: 0}
+        for q in dfa["states"]:
+            names.setdefault(q, len(names))
+        others = {q1 for q1, _ in transitions}.union(transitions.values(), dfa["accepting_states"])
+        for q in others.difference(names):
+            names.setdefault(q, len(names))
+        if not code.keys() >= {s for _, s in transitions}:
+            transitions = {(q1, s): q2 for (q1, s), q2 in transitions.items() if s in code}
+        n = len(transitions)
+        table = np.full((len(names), len(code)), -1, dtype = np.int32)
+        table[np.fromiter((names[q1] for q1, _ in transitions), np.int64, n),
+              np.fromiter((code[s] for _, s in transitions), np.int64, n)] = np.fromiter(
+            map(names.__getitem__, transitions.values()), np.int64, n
+        )
+        accepting = np.zeros(len(names), dtype = bool)
+        accepting[[names[q] for q in dfa["accepting_states"]]] = True
+        return cls(symbols, table, 0, accepting, tuple(names))
+
+    def to_dict(self):
+        """Returns the PySimpleAutomata version of the DFA."""
+        names = list(self.names) if self.names is not None else list(range(1, self.n_states + 1))
+        rows, cols = np.nonzero(self.table >= 0)
+        return {
+            "alphabet": set(self.symbols),
+            "states": set(names),
+            "initial_state": names[self.initial_state],
+            "transitions": {
+                (names[q1], self.symbols[j]): names[q2]
+                for q1, j, q2 in zip(rows.tolist(), cols.tolist(), self.table[rows, cols].tolist())
+            },
+            "accepting_states": {names[q] for q in np.flatnonzero(self.accepting).tolist()},
+        }
+
+    @property
+    def n_states(self):
+        return len(self.accepting)
+
+    @property
+    def n_transitions(self):
+        return int(np.count_nonzero(self.table >= 0))
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes + self.accepting.nbytes
+
+    def codes(self, symbols):
+        """Returns the column indices of the symbols (-1 for unknown symbols)."""
+        code = {s: j for j, s in enumerate(self.symbols)}
+        return np.array([code.get(s, -1) for s in symbols], dtype = np.int64)
+
+    def run(self, words, *others):
+        """Returns the acceptance flags of a batch of words and, for each word, the first
+        position after which it can no longer be accepted.
+
+        words is an (n_words x T) array of column indices (-1 for unknown symbols).
+        The position is T for a word that ends in a rejecting state and -1 for
+        an accepted word. The other compact DFAs are run in lockstep (without
+        intersecting them): a word has to be accepted by all of them, and its
+        position is the earliest over the DFAs run alone (not the position in
+        their intersection, which can be earlier).
+        """
+        dfas = (self,) + others
+        k = len(self.symbols)
+        words = np.atleast_2d(np.asarray(words, dtype = np.int64))
+        words = np.where(words >= 0, words, k)
+
+        # one flat table of all the DFAs, with a sink row each and a sink column for unknown symbols
+        tables, lives, accepting, initial, offset = [], [], [], [], 0
+        for dfa in dfas:
+            n, codes = dfa.n_states, dfa.codes(self.symbols)
+            table = np.full((n + 1, k + 1), n, dtype = np.int64)
+            table[:n, np.flatnonzero(codes >= 0)] = dfa.table[:, codes[codes >= 0]]
+            table[table < 0] = n
+            tables.append(table + offset)
+            lives.append(np.append(_co_reachable(dfa.table, dfa.accepting), False))
+            accepting.append(np.append(dfa.accepting, False))
+            initial.append(dfa.initial_state + offset)
+            offset += n + 1
+        table = np.vstack(tables).ravel()
+        live, accepting = np.concatenate(lives), np.concatenate(accepting)
+
+        states = np.tile(np.array(initial, dtype = np.int64), (len(words), 1))
+        violations = np.full(len(words), -1, dtype = np.int64)
+        active = np.arange(len(words)) if live[initial].all() else np.arange(0)
+        violations[len(active):] = 0
+
+        # advance the words that can still be accepted, one position at a time
+        for t in range(words.shape[1]):
+            targets = table[states[active] * (k + 1) + words[active, t][:, None]]
+            dead = ~live[targets].all(axis = 1)
+            violations[active[dead]] = t
+            active = active[~dead]
+            states[active] = targets[~dead]
+        accepted = np.zeros(len(words), dtype = bool)
+        accepted[active] = accepting[states[active]].all(axis = 1)
+        violations[active[~accepted[active]]] = words.shape[1]
+        return accepted, violations
+
+    def intersection(*dfas, stats = None):
+        """Returns the intersection of the compact DFAs in input."""
+        common = set.intersection(*[set(dfa.symbols) for dfa in dfas])
+        symbols = tuple(s for s in dfas[0].symbols if s in common)
+        sizes = np.array([dfa.n_states for dfa in dfas], dtype = np.int64)
+        if np.prod(sizes.astype(float)) >= 2.0**62:
+            half = len(dfas) // 2
+            return Compact_DFA.intersection(
+                Compact_DFA.intersection(*dfas[:half]),
+                Compact_DFA.intersection(*dfas[half:]),
+                stats = stats,
+            )
+        lives = [_co_reachable(dfa.table, dfa.accepting) for dfa in dfas]
+        if not all(live[dfa.initial_state] for dfa, live in zip(dfas, lives)):
+            return _empty(symbols)
+        tables = []
+        for dfa, live in zip(dfas, lives):
+            table = dfa.table[:, dfa.codes(symbols)]
+            tables.append(np.where(np.append(live, False)[table], table, -1))
+        radix = np.cumprod(np.append(1, sizes[:-1]))
+        initial = np.array([dfa.initial_state for dfa in dfas], dtype = np.int64)
+
+        # explore the reachable tuples level by level
+        seen = frontier = np.array([initial @ radix], dtype = np.int64)
+        arcs = []
+        while frontier.size:
+            components = (frontier[:, None] // radix) % sizes
+            level = []
+            for j in range(len(symbols)):
+                targets = np.stack([table[components[:, i], j] for i, table in enumerate(tables)], axis = 1)
+                valid = (targets >= 0).all(axis = 1)
+                codes = targets[valid] @ radix
+                arcs.append((frontier[valid], j, codes))
+                level.append(codes)
+            level = np.unique(np.concatenate(level))
+            frontier = level[~np.isin(level, seen, assume_unique = True)]
+            seen = np.union1d(seen, frontier)
+        if stats is not None:
+            stats["peak_states"] = len(seen)
+
+        table = np.full((len(seen), len(symbols)), -1, dtype = np.int32)
+        for sources, j, targets in arcs:
+            table[np.searchsorted(seen, sources), j] = np.searchsorted(seen, targets)
+        components = (seen[:, None] // radix) % sizes
+        accepting = np.all([dfa.accepting[components[:, i]] for i, dfa in enumerate(dfas)], axis = 0)
+        dfa = Compact_DFA(symbols, table, np.searchsorted(seen, initial @ radix), accepting).trimmed()
+        if stats is not None:
+            stats["states"] = dfa.n_states
+            stats["transitions"] = dfa.n_transitions
+        return dfa.renamed()
+
+    def complementation(self):
+        """Returns the complement of the compact DFA."""
+        table = np.vstack([self.table, np.full((1, len(self.symbols)), -1, dtype = np.int32)])
+        table[table < 0] = self.n_states
+        accepting = ~np.append(self.accepting, False)
+        return Compact_DFA(self.symbols, table, self.initial_state, accepting).trimmed().renamed()
+
+    def side(self, left = "", right = ""):
+        """Returns the result of the corresponding side-hypothesis operation."""
+        state = np.array([self.initial_state])
+        for j in self.codes(left):
+            state = _step(self.table, state, j)
+        states = np.arange(self.n_states)
+        for j in self.codes(right):
+            states = _step(self.table, states, j)
+        if state[0] < 0:
+            return _empty(self.symbols)
+        accepting = np.append(self.accepting, False)[states]
+        return Compact_DFA(self.symbols, self.table.copy(), state[0], accepting, self.names)
+
+    def mask(self, binary_mask):
+        """Returns the result of the corresponding periodic-mask operation."""
+        period = len(binary_mask)
+        bits = np.array([b == "1" for b in binary_mask])
+        q = np.repeat(np.arange(self.n_states), period)
+        l = np.tile(np.arange(period), self.n_states)
+        targets = np.where(bits[l][:, None], self.table[q], q[:, None])
+        table = np.where(targets >= 0, targets * period + ((l + 1) % period)[:, None], -1)
+        dfa = Compact_DFA(self.symbols, table, self.initial_state * period, self.accepting[q])
+        return dfa.restricted(_reachable(dfa.table, dfa.initial_state)).renamed()
+
+    def unfold(self, sequence):
+        """Returns the corresponding unfolded DFA."""
+        if type(sequence) == int:
+            sequence = [self.symbols] * sequence
+        allowed = [np.unique(self.codes(symbols)) for symbols in sequence]
+        allowed = [codes[codes >= 0] for codes in allowed]
+        n = len(sequence)
+
+        # expand forward
+        layers = [np.array([self.initial_state])]
+        for i in range(n):
+            targets = self.table[layers[i]][:, allowed[i]]
+            layers.append(np.unique(targets[targets >= 0]))
+        final = layers[n][self.accepting[layers[n]]]
+        if final.size == 0:
+            return _empty(self.symbols)
+
+        # validate and merge backward
+        classes = np.full(self.n_states + 1, -1, dtype = np.int64)
+        classes[final] = 0
+        signatures = [np.full((1, len(self.symbols)), -1, dtype = np.int64)]
+        for i in range(n - 1, -1, -1):
+            signature = np.full((len(layers[i]), len(self.symbols)), -1, dtype = np.int64)
+            signature[:, allowed[i]] = classes[self.table[layers[i]][:, allowed[i]]]
+            valid = (signature >= 0).any(axis = 1)
+            unique, inverse = np.unique(signature[valid], axis = 0, return_inverse = True)
+            classes = np.full(self.n_states + 1, -1, dtype = np.int64)
+            classes[layers[i][valid]] = inverse.reshape(-1)
+            signatures.append(unique)
+        signatures.reverse()
+
+        offsets = np.cumsum([0] + [len(s) for s in signatures])
+        table = np.vstack(
+            [np.where(s >= 0, s + offsets[i + 1], -1) for i, s in enumerate(signatures)]
+        )
+        accepting = np.zeros(offsets[-1], dtype = bool)
+        accepting[-1] = True
+        return Compact_DFA(self.symbols, table, 0, accepting)
+
+    def minimized(self):
+        """Returns the minimal DFA of the same language (Hopcroft's algorithm), in canonical form."""
+        dfa = self.trimmed()
+        if not dfa.accepting.any():
+            return _empty(self.symbols)
+        n, k = dfa.table.shape
+        table = np.where(dfa.table >= 0, dfa.table, n)
+        table = np.vstack([table, np.full((1, k), n, dtype = np.int32)])
+        predecessors = []
+        for j in range(k):
+            order = np.argsort(table[:, j], kind = "stable")
+            bounds = np.searchsorted(table[order, j], np.arange(n + 2))
+            predecessors.append(np.split(order, bounds[1:-1]))
+
+        # refine the partition {accepting, rejecting + sink}
+        accepting = np.append(dfa.accepting, False)
+        blocks = [set(np.flatnonzero(accepting).tolist()), set(np.flatnonzero(~accepting).tolist())]
+        block_of = np.where(accepting, 0, 1).tolist()
+        smaller = 0 if len(blocks[0]) <= len(blocks[1]) else 1
+        waiting = {(smaller, j) for j in range(k)}
+        while waiting:
+            b, j = waiting.pop()
+            splitter = defaultdict(list)
+            for q in blocks[b]:
+                for p in predecessors[j][q].tolist():
+                    splitter[block_of[p]].append(p)
+            for c, states in splitter.items():
+                if len(states) < len(blocks[c]):
+                    new = len(blocks)
+                    blocks.append(set(states))
+                    blocks[c].difference_update(states)
+                    for q in states:
+                        block_of[q] = new
+                    for i in range(k):
+                        if (c, i) in waiting:
+                            waiting.add((new, i))
+                        else:
+                            waiting.add((new if len(blocks[new]) <= len(blocks[c]) else c, i))
+
+        block_of = np.array(block_of)
+        representatives = np.array([min(block) for block in blocks])
+        quotient = block_of[table[representatives]]
+        sink = block_of[n]
+        quotient = np.where(quotient == sink, -1, quotient)
+        quotient[sink] = -1
+        minimal = Compact_DFA(self.symbols, quotient, block_of[dfa.initial_state], accepting[representatives])
+        return minimal.canonical()
+
+    def canonical(self):
+        """Returns the DFA restricted to its reachable states, with symbols sorted
+        and states numbered in breadth-first order."""
+        order = sorted(range(len(self.symbols)), key = lambda j: repr(self.symbols[j]))
+        table = self.table[:, order]
+        # breadth-first numbering, one level at a time: a level lists the new successors of the
+        # previous one in the order of their first occurrence in its rows
+        index = np.full(self.n_states + 1, -1, dtype = np.int32)
+        index[self.initial_state] = 0
+        states = level = np.array([self.initial_state], dtype = np.int64)
+        while level.size:
+            successors = table[level].ravel()
+            successors = successors[successors >= 0]
+            successors = successors[index[successors] < 0]
+            level = successors[np.sort(np.unique(successors, return_index = True)[1])].astype(np.int64)
+            index[level] = np.arange(len(states), len(states) + len(level))
+            states = np.concatenate((states, level))
+        return Compact_DFA(
+            [self.symbols[j] for j in order], index[table[states]], 0, self.accepting[states]
+        )
+
+    def digest(self):
+        """Returns a content hash of the DFA, stable across runs and machines."""
+        content = sha1(repr(self.symbols).encode())
+        content.update(np.int64(self.initial_state).tobytes())
+        content.update(self.table.astype("<i4").tobytes())
+        content.update(self.accepting.tobytes())
+        return content.hexdigest()
+
+    def trimmed(self):
+        """Returns the DFA restricted to its reachable and co-reachable states."""
+        keep = _reachable(self.table, self.initial_state) & _co_reachable(self.table, self.accepting)
+        keep[self.initial_state] = True
+        return self.restricted(keep)
+
+    def restricted(self, keep):
+        """Returns the DFA restricted to the states of the boolean mask keep."""
+        index = np.full(self.n_states + 1, -1, dtype = np.int32)
+        index[np.flatnonzero(keep)] = np.arange(np.count_nonzero(keep))
+        names = None if self.names is None else tuple(q for q, k in zip(self.names, keep) if k)
+        return Compact_DFA(
+            self.symbols, index[self.table[keep]], index[self.initial_state], self.accepting[keep], names
+        )
+
+    def renamed(self):
+        """Returns the DFA with the initial state first and the accepting states last."""
+        others = np.arange(self.n_states) != self.initial_state
+        order = np.concatenate(
+            [
+                [self.initial_state],
+                np.flatnonzero(others & ~self.accepting),
+                np.flatnonzero(others & self.accepting),
+            ]
+        ).astype(np.int64)
+        index = np.full(self.n_states + 1, -1, dtype = np.int32)
+        index[order] = np.arange(self.n_states)
+        return Compact_DFA(self.symbols, index[self.table[order]], 0, self.accepting[order])
+
+
+def _empty(symbols):
+    return Compact_DFA(symbols, np.full((1, len(symbols)), -1, dtype = np.int32), 0, [False])
+
+
+def _step(table, states, j):
+    if j < 0:
+        return np.full(len(states), -1, dtype = np.int64)
+    return np.where(states >= 0, table[states, j], -1)
+
+
+def _gather(indptr, indices, nodes):
+    starts = indptr[nodes]
+    counts = indptr[nodes + 1] - starts
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return indices[offsets + np.arange(counts.sum())]
+
+
+def _reachable(table, initial_state):
+    seen = np.zeros(len(table), dtype = bool)
+    seen[initial_state] = True
+    frontier = np.array([initial_state])
+    while frontier.size:
+        targets = table[frontier].ravel()
+        targets = np.unique(targets[targets >= 0])
+        frontier = targets[~seen[targets]]
+        seen[frontier] = True
+    return seen
+
+
+def _co_reachable(table, accepting):
+    sources = np.repeat(np.arange(len(table)), table.shape[1])
+    targets = table.ravel()
+    valid = targets >= 0
+    sources, targets = sources[valid], targets[valid]
+    order = np.argsort(targets, kind = "stable")
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(targets, minlength = len(table)))])
+    predecessors = sources[order]
+    seen = accepting.copy()
+    frontier = np.flatnonzero(seen)
+    while frontier.size:
+        frontier = np.unique(_gather(indptr, predecessors, frontier))
+        frontier = frontier[~seen[frontier]]
+        seen[frontier] = True
+    return seen
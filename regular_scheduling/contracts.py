@@ -0,0 +1,87 @@
+from regular_scheduling.standard_rules import knapsack,cardinality,stretch,pattern
+from regular_scheduling.operations import side,windows,periodic,mask,union,complementation,intersection
+from regular_scheduling.compact import Compact_DFA
+from concurrent.futures import ProcessPoolExecutor
+
+def rule_1(data,g):
+    """ Return the rule forbidding the successions of contract g."""
+    Sigma,o,F = data["Sigma"],data["o"],data["F"][g]
+    return windows(union(*[pattern((s,F[s],Sigma.difference({s}.union(F[s]))),[s,F[s]]) for s in Sigma.difference({o})]),2,upper_bound=0)
+
+def rule_2(data,g):
+    """ Return the rule bounding the working stretchs of contract g from above."""
+    Sigma,o = data["Sigma"],data["o"]
+    return stretch((Sigma.difference({o}),o),upper_bounds = (data["gamma_max"][g],float("inf")))
+
+def rule_3(data,g):
+    """ Return the rule bounding the working stretchs of contract g from below."""
+    Sigma,o,gamma_min = data["Sigma"],data["o"],data["gamma_min"][g]
+    return side(stretch((Sigma.difference({o}),o),lower_bounds=(gamma_min,1)),[Sigma.difference({o}).copy().pop()]*(gamma_min),[Sigma.difference({o}).copy().pop()]*(gamma_min))
+
+def rule_4(data,g):
+    """ Return the rule bounding the rest stretchs of contract g from below."""
+    Sigma,o,delta_min = data["Sigma"],data["o"],data["delta_min"][g]
+    return side(stretch((Sigma.difference({o}),o),lower_bounds=(1,delta_min)),[o]*(delta_min),[o]*(delta_min))
+
+def rule_5(data,g,timed = False):
+    """ Return the rule bounding the worked weekends of contract g (a Timed_DFA if timed)."""
+    Sigma,o = data["Sigma"],data["o"]
+    return mask(periodic(cardinality((Sigma.difference({o}),o),lower_bounds=(1,0)),2,windows(complementation(stretch(("0","1"),upper_bounds=(float("inf"),data["nu_max"][g]))),2,upper_bound=0),timed=timed),"0000011",timed=timed)
+
+def rule_6(data,g,timed = False):
+    """ Return the rule bounding the weekly workload of contract g (a Timed_DFA if timed)."""
+    tau = data["tau"]
+    return periodic(knapsack(tuple(tau.keys()),tuple(tau.values()),upper_bound=data["tau_max"][g]),7,timed=timed)
+
+def rule_7(data,g):
+    """ Return the rule bounding the number of each shift over 7 days of contract g."""
+    o,rho_max = data["o"],data["rho_max"][g]
+    return windows(complementation(cardinality(tuple(rho_max.keys())+(o,),upper_bounds=tuple(rho_max.values())+(float("inf"),),length=7,minimal=True)),7,0,0)
+
+rules = {1:rule_1,2:rule_2,3:rule_3,4:rule_4,5:rule_5,6:rule_6,7:rule_7}
+
+timed_rules = (5,6)
+
+def contract_rules(data,g,timed = False):
+    """ Return the rules {1: dfa, ..., 7: dfa} of contract g (see offline data). If timed, the periodic rules are
+    Timed_DFA, which do not count the day of the week in their states but can only be unfolded."""
+    return {i:rule(data,g,timed = True) if timed and i in timed_rules else rule(data,g) for i,rule in rules.items()}
+
+def regular_rules(data,timed = False):
+    """ Return the rules of every contract of the offline data (see contract_rules for timed)."""
+    return {g:contract_rules(data,g,timed) for g in data["G"]}
+
+def parallel_rules(data,processes = None,intersect = False):
+    """ Return the rules of every contract of the offline data, built in a pool of processes.
+
+    The (contract, rule) builds are distributed over the workers, which return
+    the automata as picklable Compact_DFA without state labels (states are
+    renamed 1..n). If intersect, each worker builds the 7 rules of a contract
+    and their intersection, and (rules, {g: dfa}) is returned.
+    """
+    with ProcessPoolExecutor(processes,initializer = __init_worker,initargs = (data,)) as pool:
+        if intersect:
+            results = dict(zip(data["G"],pool.map(__compile_contract,data["G"])))
+            return {g:{i:dfa.to_dict() for i,dfa in r.items()} for g,(r,_) in results.items()},{g:dfa.to_dict() for g,(_,dfa) in results.items()}
+        tasks = [(g,i) for i in sorted(rules,reverse = True) for g in data["G"]]
+        compiled = dict(zip(tasks,pool.map(__compile_rule,tasks)))
+        return {g:{i:compiled[g,i].to_dict() for i in rules} for g in data["G"]}
+
+__data = None
+
+def __init_worker(data):
+    global __data
+    __data = data
+
+def __compact(dfa):
+    dfa = Compact_DFA.from_dict(dfa)
+    dfa.names = None
+    return dfa
+
+def __compile_rule(task):
+    g,i = task
+    return __compact(rules[i](__data,g))
+
+def __compile_contract(g):
+    r = contract_rules(__data,g)
+    return {i:__compact(dfa) for i,dfa in r.items()},__compact(intersection(*r.values()))
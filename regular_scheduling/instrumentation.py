@@ -0,0 +1,126 @@
+"""Opt-in instrumentation of the automaton operations and of the regular constraints.
+
+Operations decorated with instrumented and blocks wrapped in measure report
+into the active Recorder, if any:
+
+    with instrument() as recorder:
+        model = p_rb_mip(data, r)
+    recorder.to_csv("build.csv")
+
+Each record holds the operation, the ctname of the enclosing regular
+constraint, the wall time, the input/output state and transition counts and
+any metric added by the block (layer widths, flow variables, constraints).
+When no recorder is active, the only overhead is a global lookup per call.
+"""
+import csv
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+
+_recorder = None
+
+
+class Recorder:
+
+    def __init__(self):
+        """Collect the records of the instrumented operations."""
+        self.records = []
+        self.scopes = [None]
+
+    def aggregate(self):
+        """Returns the records aggregated per ctname and operation."""
+        aggregated = {}
+        for record in self.records:
+            key = (record["ctname"], record["operation"])
+            total = aggregated.setdefault(key, {"ctname": key[0], "operation": key[1], "calls": 0})
+            total["calls"] += 1
+            for metric, value in record.items():
+                if metric in ("ctname", "operation"):
+                    continue
+                if isinstance(value, (int, float)):
+                    total[metric] = total.get(metric, 0) + value
+                elif isinstance(value, list):
+                    total.setdefault(metric, []).append(value)
+        return aggregated
+
+    def to_dict(self):
+        """Returns the aggregated records as {ctname: {operation: metrics}}."""
+        result = {}
+        for (ctname, operation), total in self.aggregate().items():
+            result.setdefault(ctname, {})[operation] = {
+                k: v for k, v in total.items() if k not in ("ctname", "operation")
+            }
+        return result
+
+    def to_csv(self, path):
+        """Writes the aggregated records in a CSV file (one row per ctname and operation)."""
+        rows = list(self.aggregate().values())
+        fields = ["ctname", "operation", "calls"]
+        for row in rows:
+            fields += [k for k in row if k not in fields]
+        with open(path, "w", newline = "") as f:
+            writer = csv.DictWriter(f, fieldnames = fields)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow({k: ";".join(map(str, v)) if isinstance(v, list) else v for k, v in row.items()})
+
+
+@contextmanager
+def instrument():
+    """Activates a new Recorder for the duration of the block and yields it."""
+    global _recorder
+    previous, _recorder = _recorder, Recorder()
+    try:
+        yield _recorder
+    finally:
+        _recorder = previous
+
+
+@contextmanager
+def measure(operation, ctname = None):
+    """Records the wall time of the block and yields a dict of additional metrics.
+
+    Operations run inside the block are attributed to ctname (or to the
+    ctname of the enclosing block).
+    """
+    recorder = _recorder
+    if recorder is None:
+        yield {}
+        return
+    if ctname is None:
+        ctname = recorder.scopes[-1]
+    record = {"operation": operation, "ctname": ctname}
+    recorder.scopes.append(ctname)
+    t0 = perf_counter()
+    try:
+        yield record
+    finally:
+        record["time"] = perf_counter() - t0
+        recorder.scopes.pop()
+        recorder.records.append(record)
+
+
+def instrumented(function):
+    """Decorates an automaton operation so that it reports into the active Recorder."""
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        if _recorder is None:
+            return function(*args, **kwargs)
+        with measure(function.__name__) as record:
+            dfas = [arg for arg in args if _size(arg)]
+            result = function(*args, **kwargs)
+            record["input_states"] = sum(_size(dfa)[0] for dfa in dfas)
+            record["input_transitions"] = sum(_size(dfa)[1] for dfa in dfas)
+            record["output_states"], record["output_transitions"] = _size(result) or (0, 0)
+        return result
+
+    return wrapper
+
+
+def _size(dfa):
+    if isinstance(dfa, dict) and "transitions" in dfa:
+        return len(dfa["states"]), len(dfa["transitions"])
+    if hasattr(dfa, "n_states") and hasattr(dfa, "n_transitions"):
+        return dfa.n_states, dfa.n_transitions
+    return None
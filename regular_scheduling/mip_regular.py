@@ -1,7 +1,8 @@
 from docplex.mp.model import Model
-from regular_scheduling.operations import intersection,unfold
-from collections import defaultdict
-from itertools import product
+from docplex.mp.error_handler import InfoLevel
+from regular_scheduling.operations import cached_unfold,fingerprint,incremental_unfold,cached_symbol_classes,cached_compress
+from regular_scheduling.instrumentation import measure
+import numpy as np
 
 from regular_scheduling.tools import show
 
@@ -11,60 +12,541 @@ class Regular_Model(Model):
         """ Create a docplex.mp.model.Model instance."""
         super().__init__(name,context,**kwargs)
         self.regular_solutions = {}
+        self.regular_constraints = []
         self.building_time = None
 
-    def add_regular_constraint(self,x,number,sequence,*dfas, ctname = None):
-        """ Add (and return) a set of regular based constraints."""
-        dfa = intersection(*dfas)
-        dfa = unfold(dfa,sequence)
+    def add_regular_constraint(self,x,number,sequence,*dfas, ctname = None, units = None, classes = False, presolve = False):
+        """ Add (and return) a set of regular based constraints (units labels the number words in the solution).
 
-        if type(sequence) == int:
-            sequence = [dfa["alphabet"]]*sequence
-        T = len(sequence)
+        If classes, the symbols with the same transitions in every DFA (and all with or all without x variables) are
+        merged: the flows have one arc per class, linked to the sum of the x of its symbols allowed by the sequence on
+        their day (the x of the other symbols are fixed to 0). The classes do not depend on the sequence, so that the
+        compressed DFAs and their intersection are shared by the units with the same rules.
 
-        delta_minus,delta_plus,sigma = [defaultdict(set) for _ in range(T)],[defaultdict(set) for _ in range(T)],[defaultdict(set) for _ in range(T)]
+        If presolve, the layered graph is reduced before the constraints are emitted (see _presolve): the arcs whose x
+        are all fixed to 0 are removed, the parallel arcs without x are merged and the arcs of a chain of nodes with one
+        inflow and one outflow share one flow variable (without conservation rows)."""
+        with measure("add_regular_constraint",ctname) as metrics:
+            linked = {s for _,s in x.keys()}
+            days = sequence
+            classes = cached_symbol_classes(*dfas,sequence = [linked]) if classes else None
+            if classes:
+                dfas = [cached_compress(dfa,classes) for dfa in dfas]
+                if type(sequence) != int:
+                    sequence = [{c for c,members in classes.items() if not symbols.isdisjoint(members)} for symbols in sequence]
+            dfa = cached_unfold(sequence,*dfas)
+            T,n,symbols,tails,codes,heads,layers,widths = _layered_graph(dfa,sequence)
+            code = {s:i for i,s in enumerate(symbols)}
+            member = {s:c for c,members in classes.items() for s in members} if classes else {}
 
-        level = {dfa["initial_state"]}
-        for t in range(T):
-            for q1,s in [(q,s) for q,s in product(level,sequence[t]) if (q,s) in dfa["transitions"]]:
-                q2 = dfa["transitions"][q1,s]
-                delta_plus[t][q1].add((s,q2))
-                delta_minus[t][q2].add((q1,s))
-                sigma[t][s].add((q1,q2))
-            level = delta_minus[t].keys()
+            start = min(t for t,_ in x.keys())
+            groups,excluded = {},set()
+            for t,s in x.keys():
+                if classes and type(days) != int and 0 <= t-start < len(days) and s not in days[t-start]:
+                    excluded.add((t,s))
+                groups.setdefault((t,None if (t,s) in excluded else member.get(s,s)),[]).append(x[t,s])
+            links = [(t-start)*len(code)+code[c] if c in code else None for t,c in groups]
 
+            metrics["nodes"],metrics["arcs"] = n,len(tails)
+            metrics["rows"] = len(np.unique(tails))
+            if presolve:
+                fixed = [r for xs,r in zip(groups.values(),links) if r is not None and all(v.ub == 0 for v in xs)]
+                n,tails,codes,heads,layers,variables,series = _presolve(T,n,tails,codes,heads,layers,links,fixed,len(code))
+            else:
+                variables,series = None,np.zeros(n,dtype = bool)
+            metrics["presolved_nodes"],metrics["presolved_arcs"] = n,len(tails)
+
+            # CSR incidence: arcs -> tail nodes (outflow), arcs -> head nodes (inflow), arcs -> (t,s) linking rows
+            out_order,out_ptr = _csr(tails,n)
+            in_order,in_ptr = _csr(heads,n)
+            link_order,link_ptr = _csr(layers*len(code)+codes,T*len(code))
+
+            flows = self.continuous_var_list(len(tails) if variables is None else int(variables.max(initial = -1))+1,lb = 0, ub = number)
+            f = np.array(flows,dtype = object)
+            f = f if variables is None else f[variables]
+            f_out,f_in,f_link = f[out_order],f[in_order],f[link_order]
+            rows = [j for j in range(1,n) if out_ptr[j] < out_ptr[j+1] and not series[j]]
+            metrics["presolved_rows"] = 1+len(rows)
+
+            flow_constraints = []
+            flow_constraints += [self.add_constraint(self.sum_vars(f_out[out_ptr[0]:out_ptr[1]]) == number)]
+            flow_constraints += self.add_constraints(self.sum_vars(f_in[in_ptr[j]:in_ptr[j+1]]) == self.sum_vars(f_out[out_ptr[j]:out_ptr[j+1]]) for j in rows)
+            flow_constraints += self.add_constraints(self.sum_vars(xs) == (self.sum_vars(f_link[link_ptr[r]:link_ptr[r+1]]) if r is not None else 0) for xs,r in zip(groups.values(),links))
+
+            regular_ct = Regular_Constraint(ctname,number,T,flow_constraints,flows,symbols,tails,codes,heads,layers,units,x,classes,variables,excluded)
+            self.regular_constraints.append(regular_ct)
+            if ctname:
+                self.regular_solutions[ctname] = regular_ct
+
+            metrics["output_states"] = len(dfa["states"])
+            metrics["output_transitions"] = len(dfa["transitions"])
+            metrics["layer_widths"] = widths
+            metrics["flow_variables"] = len(flows)
+            metrics["constraints"] = len(flow_constraints)
+            metrics["symbol_classes"] = len(symbols)
+
+            return regular_ct
+
+    def add_grouped_regular_constraints(self,units,keys,ctname = "flow ",classes = False,presolve = False):
+        """ Add the regular based constraints of the units {unit: (sequence, dfas, signature)}: the units with the same
+        sequence, rules and signature (e.g. their preferences) share one flow of size k, and the list of (members, x)
+        is returned, where x[key] is the number of members assigned to key = (t, s) (see add_regular_constraint for
+        classes and presolve)."""
+        groups = {}
+        for unit,(sequence,dfas,signature) in units.items():
+            key = (sequence if type(sequence) == int else tuple(frozenset(s) for s in sequence),tuple(fingerprint(dfa) for dfa in dfas),signature)
+            groups.setdefault(key,(sequence,dfas,[]))[2].append(unit)
+        grouped = []
+        for sequence,dfas,members in groups.values():
+            name = ctname+"+".join(map(str,members))
+            if len(members) == 1:
+                x = self.binary_var_dict(keys,name = name)
+            else:
+                x = self.integer_var_dict(keys,lb = 0,ub = len(members),name = name)
+            self.add_regular_constraint(x,len(members),sequence,*dfas,ctname = name,units = members,classes = classes,presolve = presolve)
+            grouped.append((members,x))
+        return grouped
+
+    def add_rolling_regular_constraint(self,x,number,sequence,*dfas, ctname = None, units = None):
+        """ Add (and return) a set of regular based constraints that can be moved to another sequence (e.g. a longer
+        horizon or other days-off) by update_regular_constraint."""
+        with measure("add_rolling_regular_constraint",ctname) as metrics:
+            regular_ct = Rolling_Regular_Constraint(ctname,number,incremental_unfold(sequence,*dfas),units)
+            regular_ct.x = x
+            self.__update_flows(regular_ct,x,0,metrics)
+            self.regular_constraints.append(regular_ct)
+            if ctname:
+                self.regular_solutions[ctname] = regular_ct
+            return regular_ct
+
+    def update_regular_constraint(self,regular_ct,x,sequence):
+        """ Move a rolling regular constraint to the new sequence, rebuilding only the flow variables and constraints
+        of the layers that changed (x has to contain the variables of the new days)."""
+        with measure("update_regular_constraint",regular_ct.ctname) as metrics:
+            self.__update_flows(regular_ct,x,regular_ct.unfolding.update(sequence),metrics)
+            regular_ct.x = x
+            return regular_ct
+
+    def __update_flows(self,regular_ct,x,first,metrics):
+        unfolding,number = regular_ct.unfolding,regular_ct.number
+        T = len(unfolding.sequence)
         start = min(t for t,_ in x.keys())
 
-        f = self.continuous_var_dict(((q1,s,q2) for c in delta_plus for q1,arcs in c.items() for s,q2 in arcs),lb = 0, ub = number)   
-        
-        flow_constraints = []
-        flow_constraints += [self.add_constraint(self.sum(f[q0,s,q] for q0,arcs in delta_plus[0].items() for s,q in arcs) == number)]        
-        flow_constraints += self.add_constraints(self.sum(f[q1,s,q] for q1,s in delta_minus[i][q]) == self.sum(f[q,s,q2] for s,q2 in c[q]) for i,c in enumerate(delta_plus[1:]) for q in c)
-        flow_constraints += self.add_constraints(x[t,s] == self.sum(f[q1,s,q2] for q1,q2 in sigma[t-start][s]) for t,s in x.keys())
-
-        def post_processing():
-            if not self.solution:
-                return None
-            regular_solution = [[None]*T for _ in range(number)]
-            f_star = {(q1,s,q2):round(self.solution.get_value(f[q1,s,q2])) for q1,s,q2 in f.keys()}
-            for i in range(number):   
-                q1 = dfa["initial_state"]
-                for t in range(T):
-                    s,q2 = next((s,q) for s,q in delta_plus[t][q1] if f_star[q1,s,q])
-                    f_star[q1,s,q2] -= 1
-                    regular_solution[i][t],q1 = s,q2
-            return regular_solution
-        
-        if ctname:
-            self.regular_solutions[ctname] = post_processing
-        self.regular_solutions[str(flow_constraints)] = post_processing
-
-        return flow_constraints
-    
+        # the constraints of the changed layers are recycled (removing constraints reindexes the whole model)
+        recycled = [ct for cts in regular_ct.conservation[first:]+regular_ct.linking[first:] for ct in cts]
+        if first == 0 and regular_ct.source is not None:
+            recycled.append(regular_ct.source)
+        del regular_ct.conservation[first:],regular_ct.linking[first:]
+
+        # keep the flow variables of the arcs that remain, fix the others to 0
+        added = 0
+        for t in range(first,max(T,len(regular_ct.layer_flows))):
+            old = regular_ct.layer_flows[t] if t < len(regular_ct.layer_flows) else {}
+            arcs = unfolding.merged_arcs(t) if t < T else []
+            new = [arc for arc in arcs if arc not in old]
+            flows = dict(zip(new,self.continuous_var_list(len(new),lb = 0, ub = number)))
+            flows = {arc:old[arc] if arc in old else flows[arc] for arc in arcs}
+            for arc,var in old.items():
+                if arc not in flows:
+                    var.ub = 0
+            if t < len(regular_ct.layer_flows):
+                regular_ct.layer_flows[t] = flows
+            else:
+                regular_ct.layer_flows.append(flows)
+            added += len(new)
+        del regular_ct.layer_flows[T:]
+
+        # constraints of the changed layers
+        if first == 0:
+            regular_ct.source = self.__recycle([(self.sum_vars(list(regular_ct.layer_flows[0].values()) if T else []),number)],recycled)[0]
+        days = {}
+        for t,s in x.keys():
+            days.setdefault(t-start,[]).append(s)
+        for t in range(first,T):
+            inflows,outflows,symbols = {},{},{}
+            for (q1,s,q2),var in regular_ct.layer_flows[t].items():
+                outflows.setdefault(q1,[]).append(var)
+                symbols.setdefault(s,[]).append(var)
+            if t > 0:
+                for (q1,s,q2),var in regular_ct.layer_flows[t-1].items():
+                    inflows.setdefault(q2,[]).append(var)
+            regular_ct.conservation.append(self.__recycle([(self.sum_vars(inflows[q]),self.sum_vars(vs)) for q,vs in outflows.items()] if t > 0 else [],recycled))
+            regular_ct.linking.append(self.__recycle([(x[start+t,s],self.sum_vars(symbols.get(s,[]))) for s in days.get(t,[])],recycled))
+        if recycled:
+            self.remove_constraints(recycled)
+        regular_ct.refresh()
+
+        metrics["first_layer"] = first
+        metrics["flow_variables"] = added
+        metrics["constraints"] = sum(len(cts) for cts in regular_ct.conservation[first:]+regular_ct.linking[first:])+(first == 0)
+
+    def __recycle(self,rows,recycled):
+        cts = []
+        while rows and recycled:
+            ct = recycled.pop()
+            ct.lhs,ct.rhs = rows.pop()
+            cts.append(ct)
+        return cts+self.add_constraints(lhs == rhs for lhs,rhs in rows)
+
+    def add_regular_columns(self,x,number,sequence,*dfas, ctname = None, units = None):
+        """ Add (and return) the master part of a set of regular based constraints solved by column generation: x is
+        linked to columns (words of the unfolded DFAs) whose values sum to number, and generate_columns prices new
+        columns over the layered graph. It is seeded with one column."""
+        with measure("add_regular_columns",ctname) as metrics:
+            dfa = cached_unfold(sequence,*dfas)
+            T,_,symbols,tails,codes,heads,layers,widths = _layered_graph(dfa,sequence)
+            code = {s:i for i,s in enumerate(symbols)}
+            start = min(t for t,_ in x.keys())
+
+            links = {(t-start,code[s]):(t,s) for t,s in x.keys() if s in code}
+            linking = self.add_constraints(x[key] == self.linear_expr() for key in links.values())
+            fixed = self.add_constraints(x[t,s] == 0 for t,s in x.keys() if s not in code)
+            regular_ct = Regular_Columns(ctname,number,T,symbols,tails,codes,heads,layers,dict(zip(links,linking)),units,x)
+            regular_ct.constraints += linking+fixed
+            self.__add_column(regular_ct,_shortest_path(regular_ct,np.zeros(len(tails)))[1])
+            self.regular_constraints.append(regular_ct)
+            if ctname:
+                self.regular_solutions[ctname] = regular_ct
+
+            metrics["output_states"] = len(dfa["states"])
+            metrics["output_transitions"] = len(dfa["transitions"])
+            metrics["layer_widths"] = widths
+            metrics["constraints"] = len(regular_ct.constraints)
+
+            return regular_ct
+
+    def generate_columns(self,max_iterations = 100,tolerance = 1e-6):
+        """ Solve the linear relaxation of the model by column generation over its regular columns (the pricing of a
+        set of columns is a shortest path over its layered graph, weighted by the duals of its linking constraints),
+        then restore the types of the variables, the columns being integer, so that solve() gives a price-and-branch
+        solution. Return the number of generated columns."""
+        handles = [handle for handle in self.regular_constraints if isinstance(handle,Regular_Columns)]
+        if not handles:
+            return 0
+        with measure("generate_columns") as metrics:
+            discrete = [v for v in self.iter_variables() if v.is_discrete()]
+            vartypes = [v.vartype for v in discrete]
+            self.change_var_types(discrete,self.continuous_vartype)
+            self.get_cplex().set_problem_type(0) # as in docplex's LinearRelaxer, the relaxed model stays a MILP otherwise
+            sense = 1 if self.is_minimized() else -1
+            added,iterations = 0,0
+            while iterations < max_iterations and self.solve():
+                iterations += 1
+                priced = 0
+                for handle in handles:
+                    duals = self.dual_values(list(handle.links.values())+[handle.convexity])
+                    weights = np.zeros((handle.T,len(handle.symbols)))
+                    for (t,c),dual in zip(handle.links,duals):
+                        weights[t,c] = sense*dual
+                    cost,path = _shortest_path(handle,weights[handle.layers,handle.codes])
+                    if cost < sense*duals[-1]-tolerance:
+                        self.__add_column(handle,path)
+                        priced += 1
+                added += priced
+                if not priced:
+                    break
+            metrics["iterations"] = iterations
+            metrics["columns"] = added
+            metrics["relaxation"] = self.objective_value if self.solution else None
+            # the relaxed solution is discarded (without a warning per fractional variable)
+            columns = [v for handle in handles for v in handle.flows]
+            level,self.output_level = self.output_level,InfoLevel.ERROR
+            self.change_var_types(discrete+columns,vartypes+[self.integer_vartype]*len(columns))
+            self.output_level = level
+        return added
+
+    def add_regular_start(self,demand,under,over,preferences = None,regular_cts = (),effort_level = None):
+        """ Add (and return) a MIP start built greedily from the regular based constraints with flows (all, or the given
+        handles or ctnames). Each of their words is in turn a shortest path of the layered graph, the symbol s on day
+        t costing preferences[ctname][t,s] (if any) minus under[t,s] while the residual demand of (t, s) (initially
+        demand[t,s]) is positive, and over[t,s] once it is met (the arc of a symbol class costing its cheapest symbol)."""
+        with measure("add_regular_start") as metrics:
+            handles = [self.regular_solutions[ct] if isinstance(ct,str) else ct for ct in regular_cts] or self.regular_constraints
+            handles = [handle for handle in handles if handle.x is not None and not isinstance(handle,Regular_Columns)]
+            residual = dict(demand)
+            preferences = preferences or {}
+            values = {}
+            for handle in handles:
+                code = {s:i for i,s in enumerate(handle.symbols)}
+                start = min(t for t,_ in handle.x.keys())
+                member = {s:c for c,members in (handle.classes or {}).items() for s in members}
+                keys = {}
+                for t,s in handle.x.keys():
+                    if member.get(s,s) in code and (t,s) not in handle.excluded:
+                        keys.setdefault((t-start,code[member.get(s,s)]),[]).append((t,s))
+                preference = preferences.get(handle.ctname,{})
+                cost = lambda key: preference.get(key,0)+(-under[key] if residual.get(key,0) > 0 else over[key])
+                assigned = dict.fromkeys(handle.x.keys(),0)
+                arcs = []
+                for _ in range(handle.number):
+                    best = {arc:min(members,key = cost) for arc,members in keys.items()}
+                    weights = np.zeros((handle.T,len(handle.symbols)))
+                    for (t,c),key in best.items():
+                        weights[t,c] = cost(key)
+                    path = _shortest_path(handle,weights[handle.layers,handle.codes])[1]
+                    for t,c in zip(handle.layers[path].tolist(),handle.codes[path].tolist()):
+                        if (t,c) in best:
+                            residual[best[t,c]] = residual.get(best[t,c],0)-1
+                            assigned[best[t,c]] += 1
+                    arcs.append(path)
+                counts = np.bincount(np.concatenate(arcs),minlength = len(handle.tails))
+                if handle.variables is not None:
+                    counts,arc_counts = np.zeros(len(handle.flows),dtype = np.int64),counts
+                    counts[handle.variables] = arc_counts
+                values.update(zip(handle.flows,counts.tolist()))
+                values.update((handle.x[key],v) for key,v in assigned.items())
+            warm_start = self.new_solution(values)
+            self.add_mip_start(warm_start,effort_level = effort_level)
+            metrics["words"] = sum(handle.number for handle in handles)
+            return warm_start
+
+    def __add_column(self,regular_ct,path):
+        var = self.continuous_var(lb = 0,ub = regular_ct.number)
+        for t,c in enumerate(regular_ct.codes[path].tolist()):
+            ct = regular_ct.links.get((t,c))
+            if ct is not None:
+                ct.rhs = ct.rhs+var
+        if regular_ct.convexity is None:
+            regular_ct.convexity = self.add_constraint(self.sum_vars([var]) == regular_ct.number)
+            regular_ct.constraints.append(regular_ct.convexity)
+        else:
+            regular_ct.convexity.lhs = regular_ct.convexity.lhs+var
+        regular_ct.flows.append(var)
+        regular_ct.paths.append(path)
+
     def add_regular_constraint_(self,x,number,sequence,*dfas, ctname = None):
         """ Add a set of regular based constraints."""
         self.add_regular_constraint(self,x,number,sequence,*dfas, ctname = ctname)
-    
+
     def get_regular_solution(self,regular_ct):
-        """ Retrieve words corresponding to regular based constraints in the current solution."""
-        return self.regular_solutions[str(regular_ct)]()
+        """ Retrieve words corresponding to regular based constraints (handle or ctname) in the current solution."""
+        solution = self.get_regular_solutions(regular_ct)
+        return None if solution is None else [list(word) for word in solution[1]]
+
+    def get_regular_solutions(self,*regular_cts):
+        """ Retrieve the words of all (or of the given) regular based constraints in the current solution,
+        as the list of rows (unit, or (ctname, i)) and the matrix of their shifts (rows x days)."""
+        if not self.solution:
+            return None
+        handles = [self.regular_solutions[ct] if isinstance(ct,str) else ct for ct in regular_cts] or self.regular_constraints
+        values = self.solution.get_values([v for handle in handles for v in handle.flows])
+        offsets = np.cumsum([0]+[len(handle.flows) for handle in handles])
+        values = np.concatenate([handle.arc_flows(values[i:j]) for handle,i,j in zip(handles,offsets[:-1],offsets[1:])])
+        rows,words = _decompose(handles,values)
+        return rows,_expand(handles,words,self.solution)
+
+
+class Regular_Constraint:
+    """ Handle of a set of regular based constraints, with the arcs (tail, symbol, head, layer) of its flow variables,
+    its variables x, its symbol classes {representative: symbols} (if the arcs are symbol classes), the index of the
+    flow variable of each arc (if the arcs do not have one flow variable each, in order) and the keys of the x fixed to
+    0 because their symbol is not allowed on their day (if the arcs are symbol classes)."""
+
+    __slots__ = ("ctname","number","T","constraints","flows","symbols","tails","codes","heads","layers","units","x","classes","variables","excluded")
+
+    def __init__(self,ctname,number,T,constraints,flows,symbols,tails,codes,heads,layers,units = None,x = None,classes = None,variables = None,excluded = ()):
+        self.ctname,self.number,self.T,self.constraints,self.flows = ctname,number,T,constraints,flows
+        self.symbols,self.tails,self.codes,self.heads,self.layers = symbols,tails,codes,heads,layers
+        self.units = list(units) if units is not None else [(ctname,i) for i in range(number)]
+        self.x,self.classes,self.variables,self.excluded = x,classes,variables,excluded
+
+    def arc_flows(self,values):
+        """ Return the flows of the arcs of the layered graph given the values of the flow variables."""
+        return values if self.variables is None else np.asarray(values)[self.variables]
+
+    def __iter__(self):
+        return iter(self.constraints)
+
+    def __len__(self):
+        return len(self.constraints)
+
+
+class Rolling_Regular_Constraint(Regular_Constraint):
+    """ Handle of a set of regular based constraints built from an Incremental_Unfold, with its flow variables
+    {(q1, s, q2): var} and its conservation and linking constraints per layer."""
+
+    __slots__ = ("unfolding","source","conservation","linking","layer_flows")
+
+    def __init__(self,ctname,number,unfolding,units = None):
+        super().__init__(ctname,number,0,[],[],(),*[np.zeros(0,dtype = np.int64)]*4,units)
+        self.unfolding,self.source,self.conservation,self.linking = unfolding,None,[],[]
+        self.layer_flows = []
+
+    def refresh(self):
+        """ Update the arrays of the arcs (used by the decoder) after a change of the flows."""
+        nodes = {(0,frozenset({self.unfolding.initial_state})):0}
+        arcs = [(nodes.setdefault((t,q1),len(nodes)),s,nodes.setdefault((t+1,q2),len(nodes)),t,var) for t,c in enumerate(self.layer_flows) for (q1,s,q2),var in c.items()]
+        tails,symbols,heads,layers,self.flows = (list(a) for a in zip(*arcs)) if arcs else ([] for _ in range(5))
+        self.symbols = tuple(dict.fromkeys(symbols))
+        code = {s:i for i,s in enumerate(self.symbols)}
+        self.tails,self.heads,self.layers = (np.array(a,dtype = np.int64) for a in (tails,heads,layers))
+        self.codes = np.array([code[s] for s in symbols],dtype = np.int64)
+        self.constraints = ([self.source] if self.source is not None else [])+[ct for cts in self.conservation+self.linking for ct in cts]
+        self.T = len(self.unfolding.sequence)
+
+
+class Regular_Columns(Regular_Constraint):
+    """ Handle of the master part of a set of regular based constraints solved by column generation, with the layered
+    graph of its pricing, its linking constraints {(t, symbol code): ct}, its convexity constraint and the arcs (one
+    per layer) of each of its columns (the flows)."""
+
+    __slots__ = ("links","convexity","paths")
+
+    def __init__(self,ctname,number,T,symbols,tails,codes,heads,layers,links,units = None,x = None):
+        super().__init__(ctname,number,T,[],[],symbols,tails,codes,heads,layers,units,x)
+        self.links,self.convexity,self.paths = links,None,[]
+
+    def arc_flows(self,values):
+        """ Return the flows of the arcs of the layered graph carried by the columns with the given values."""
+        return np.bincount(np.concatenate(self.paths),weights = np.repeat(values,self.T),minlength = len(self.tails))
+
+
+def _layered_graph(dfa,sequence):
+    """ Return the horizon, the number of nodes, the symbols and the arrays of the arcs (tail, symbol code, head, layer)
+    of the layered graph of an unfolded DFA along the sequence (node 0 is the source), and the widths of its layers."""
+    if type(sequence) == int:
+        sequence = [dfa["alphabet"]]*sequence
+    T = len(sequence)
+    transitions = dfa["transitions"]
+    arcs,widths = [],[1]
+    level = [dfa["initial_state"]]
+    for t in range(T):
+        reached = {}
+        for q1 in level:
+            for s in sequence[t]:
+                q2 = transitions.get((q1,s))
+                if q2 is not None:
+                    arcs.append((q1,s,q2,t))
+                    reached[q2] = None
+        level = list(reached)
+        widths.append(len(level))
+    tails,symbols,heads,layers = zip(*arcs) if arcs else ((),)*4
+    nodes = {q:j for j,q in enumerate(dict.fromkeys([dfa["initial_state"]]+list(heads)))}
+    code = {s:i for i,s in enumerate(dict.fromkeys(symbols))}
+    tails,heads = np.array([nodes[q] for q in tails],dtype = np.int64),np.array([nodes[q] for q in heads],dtype = np.int64)
+    codes,layers = np.array([code[s] for s in symbols],dtype = np.int64),np.array(layers,dtype = np.int64)
+    return T,len(nodes),tuple(code),tails,codes,heads,layers,widths
+
+def _presolve(T,n,tails,codes,heads,layers,links,fixed,symbols):
+    """ Return the reduced layered graph (number of nodes and arrays of the arcs, as _layered_graph), the index of the
+    flow variable of each arc and the mask of the nodes without conservation row. The arcs of the linking rows fixed to
+    0 are removed (with the arcs that are no longer on a path from the source to the sink), only one of the parallel
+    arcs without linking row is kept (its symbol stands for theirs) and the arcs through a node with one inflow and
+    one outflow share one variable."""
+    rows = layers*symbols+codes
+    keep = ~np.isin(rows,fixed)
+    reached,alive = np.zeros(n,dtype = bool),np.zeros(n,dtype = bool)
+    reached[0] = True
+    alive[heads[layers == T-1]] = True
+    bounds = np.searchsorted(layers,np.arange(T+1))
+    for t in range(T):
+        arcs = np.arange(bounds[t],bounds[t+1])
+        reached[heads[arcs[keep[arcs] & reached[tails[arcs]]]]] = True
+    for t in range(T-1,-1,-1):
+        arcs = np.arange(bounds[t],bounds[t+1])
+        alive[tails[arcs[keep[arcs] & alive[heads[arcs]]]]] = True
+    keep &= reached[tails] & alive[heads]
+    if not keep.any():
+        keep[:] = True
+    free = keep & ~np.isin(rows,[r for r in links if r is not None])
+    parallel = np.flatnonzero(free)
+    keep[parallel] = False
+    keep[parallel[np.unique(tails[parallel]*n+heads[parallel],return_index = True)[1]]] = True
+    tails,codes,heads,layers = tails[keep],codes[keep],heads[keep],layers[keep]
+
+    nodes,inverse = np.unique(np.concatenate(([0],tails,heads)),return_inverse = True)
+    n,tails,heads = len(nodes),inverse[1:len(tails)+1],inverse[len(tails)+1:]
+    series = (np.bincount(heads,minlength = n) == 1) & (np.bincount(tails,minlength = n) == 1)
+    series[0] = False
+    inflow,outflow = np.zeros(n,dtype = np.int64),np.zeros(n,dtype = np.int64)
+    inflow[heads],outflow[tails] = np.arange(len(heads)),np.arange(len(tails))
+    root = np.arange(len(tails))
+    root[outflow[series]] = inflow[series]
+    while True:
+        jumped = root[root]
+        if np.array_equal(jumped,root):
+            break
+        root = jumped
+    variables = np.unique(root,return_inverse = True)[1]
+    return n,tails,codes,heads,layers,variables,series
+
+def _shortest_path(handle,weights):
+    """ Return the cost and the arcs (one per layer) of a shortest path from the source to the sink of the layered
+    graph of the handle, the arcs being weighted by weights."""
+    bounds = np.searchsorted(handle.layers,np.arange(handle.T+1))
+    if bounds[-1] == bounds[-2]:
+        raise Exception("The unfolded DFA has no accepted word")
+    n = int(max(handle.tails.max(),handle.heads.max()))+1
+    dist,pred = np.full(n,np.inf),np.full(n,-1,dtype = np.int64)
+    dist[0] = 0
+    for t in range(handle.T):
+        arcs = np.arange(bounds[t],bounds[t+1])
+        costs = dist[handle.tails[arcs]]+weights[arcs]
+        order = np.lexsort((costs,handle.heads[arcs]))
+        first = np.append(True,np.diff(handle.heads[arcs][order]) != 0)
+        best = arcs[order][first]
+        dist[handle.heads[best]],pred[handle.heads[best]] = costs[order][first],best
+    node = handle.heads[bounds[-1]-1]
+    cost,path = dist[node],np.empty(handle.T,dtype = np.int64)
+    for t in range(handle.T-1,-1,-1):
+        path[t] = pred[node]
+        node = handle.tails[path[t]]
+    return cost,path
+
+def _decompose(handles,values):
+    """ Return the rows (units of the handles) and the matrix of words obtained by peeling the integral flows of the handles
+    (in the order of their flow variables in values), all the units of all the handles being moved layer by layer."""
+    symbols = list(dict.fromkeys(s for handle in handles for s in handle.symbols))
+    index = {s:i for i,s in enumerate(symbols)}
+    node_offsets = np.cumsum([0]+[len(handle.heads)+1 for handle in handles])
+    tails = np.concatenate([handle.tails+offset for handle,offset in zip(handles,node_offsets)])
+    heads = np.concatenate([handle.heads+offset for handle,offset in zip(handles,node_offsets)])
+    codes = np.concatenate([np.array([index[s] for s in handle.symbols],dtype = np.int64)[handle.codes] for handle in handles])
+    layers = np.concatenate([handle.layers for handle in handles])
+    flows = np.rint(np.asarray(values,dtype = float)).astype(np.int64)
+    order = np.lexsort((tails,layers))
+    bounds = np.searchsorted(layers[order],np.arange(max(handle.T for handle in handles)+1))
+
+    numbers = [handle.number for handle in handles]
+    horizons = np.repeat([handle.T for handle in handles],numbers)
+    positions = np.repeat(node_offsets[:-1],numbers)
+    words = np.full((len(positions),len(bounds)-1),-1,dtype = np.int64)
+    for t in range(len(bounds)-1):
+        arcs = order[bounds[t]:bounds[t+1]]
+        copies = np.repeat(arcs,flows[arcs])
+        units = np.flatnonzero(horizons > t)
+        units = units[np.argsort(positions[units],kind = "stable")]
+        if len(copies) != len(units):
+            raise Exception("The flows of the solution are not integral")
+        words[units,t] = codes[copies]
+        positions[units] = heads[copies]
+    rows = [unit for handle in handles for unit in handle.units]
+    return rows,np.array(symbols+[None],dtype = object)[words]
+
+
+def _expand(handles,words,solution):
+    """ Return the words (rows of the units of the handles) in which the representatives of the symbol classes are
+    replaced by the symbols of the x variables of their handle in the solution."""
+    first = 0
+    for handle in handles:
+        block = words[first:first+len(handle.units)]
+        first += len(handle.units)
+        if not handle.classes:
+            continue
+        member = {s:c for c,members in handle.classes.items() for s in members if len(members) > 1}
+        start = min(t for t,_ in handle.x.keys())
+        assigned = {}
+        for (t,s),value in solution.get_value_dict(handle.x,keep_zeros = False).items():
+            if s in member:
+                assigned.setdefault((t-start,member[s]),[]).extend([s]*int(round(value)))
+        for (t,c),symbols in assigned.items():
+            units = np.flatnonzero(block[:,t] == c)
+            if len(units) != len(symbols):
+                raise Exception("The symbols of the solution do not match its flows")
+            block[units,t] = symbols
+    return words
+
+def _csr(rows,n):
+    """Returns the arcs sorted by row and the row pointers of a CSR incidence structure."""
+    rows = np.asarray(rows,dtype = np.int64)
+    return np.argsort(rows,kind = "stable"),np.concatenate(([0],np.cumsum(np.bincount(rows,minlength = n))))
@@ -1,43 +1,104 @@
 from PySimpleAutomata import DFA
-from collections import defaultdict
-from itertools import product
-
+from collections import defaultdict, OrderedDict
+from hashlib import sha1
+from math import gcd, lcm
+import numpy as np
+from regular_scheduling.compact import Compact_DFA
+from regular_scheduling.instrumentation import instrumented
+
+@instrumented
 def minimize(dfa):
-    """Returns the minimal DFA with the same language as input DFA."""
-    return _rename(DFA.dfa_trimming(DFA.dfa_minimization(_rename(dfa))))
-
-
-def intersection(*dfas):
-    """Returns the intersection of the DFAs in input."""
-    dfa1 = dfas[0]
-    for dfa2 in dfas[1:]:
-        dfa1 = DFA.dfa_intersection(dfa1, dfa2)
-    alphabet = dfa1["alphabet"]
-    dfa = _rename(DFA.dfa_trimming(dfa1))
-    dfa["alphabet"] = alphabet
-    return dfa
-
-
-def union(*dfas):
-    """Returns the union of the DFAs in input."""
-    dfa1 = dfas[0]
-    for dfa2 in dfas[1:]:
-        dfa1 = DFA.dfa_union(dfa1, dfa2)
-    alphabet = dfa1["alphabet"]
-    dfa = _rename(DFA.dfa_trimming(dfa1))
-    dfa["alphabet"] = alphabet
-    return dfa
-
-
+    """Returns the minimal DFA with the same language as input DFA, in canonical form."""
+    if isinstance(dfa, Compact_DFA):
+        return dfa.minimized()
+    return Compact_DFA.from_dict(dfa).minimized().to_dict()
+
+
+def language_hash(dfa):
+    """Returns a content hash of the language of the DFA, stable across runs."""
+    if not isinstance(dfa, Compact_DFA):
+        dfa = Compact_DFA.from_dict(dfa)
+    return dfa.minimized().digest()
+
+
+def structural_hash(dfa):
+    """Returns a content hash of the DFA up to the numbering of its states, stable across runs.
+    Unlike language_hash, it does not minimize the DFA (isomorphic DFAs have the same hash)."""
+    if not isinstance(dfa, Compact_DFA):
+        dfa = Compact_DFA.from_dict(dfa)
+    return dfa.canonical().digest()
+
+
+@instrumented
+def accepts(words, *dfas, symbols = None, per_rule = False):
+    """Returns the acceptance flags of a batch of words by the DFAs in input and
+    the first violating position of each word (see Compact_DFA.run).
+
+    words is either an (n_words x T) NumPy array of the indices of their
+    symbols in symbols (sorted union of the alphabets by default) or a list of
+    words of symbols. The DFAs are run in lockstep without intersecting them: a word
+    is accepted if every DFA accepts it and its violating position is the
+    earliest over the DFAs of the position after which the DFA alone can no longer
+    accept it (the minimum of the per_rule positions). It can be later than the
+    violating position in the intersection of the DFAs, whose states can be dead
+    while the state of every DFA is still live. If per_rule, the (n_dfas x n_words)
+    flags and positions are returned instead.
+    """
+    if symbols is None:
+        alphabets = [dfa.symbols if isinstance(dfa, Compact_DFA) else dfa["alphabet"] for dfa in dfas]
+        symbols = sorted(set().union(*alphabets), key = repr)
+    symbols = tuple(symbols)
+    if not isinstance(words, np.ndarray):
+        code = {s: j for j, s in enumerate(symbols)}
+        words = [[code.get(s, -1) for s in word] for word in words]
+    words = np.atleast_2d(np.asarray(words, dtype = np.int64))
+    dfas = [dfa if isinstance(dfa, Compact_DFA) else Compact_DFA.from_dict(dfa, symbols) for dfa in dfas]
+
+    def coded(dfa):
+        return words if dfa.symbols == symbols else np.append(dfa.codes(symbols), -1)[words]
+
+    if per_rule:
+        flags, violations = zip(*[dfa.run(coded(dfa)) for dfa in dfas])
+        return np.array(flags), np.array(violations)
+    return dfas[0].run(coded(dfas[0]), *dfas[1:])
+
+
+@instrumented
+def intersection(*dfas, order = None, stats = None):
+    """Returns the intersection of the DFAs in input.
+
+    Only the reachable and co-reachable tuples are built. The operands can be
+    reordered by "size" or "selectivity" and the peak number of product states
+    is written in the stats dict if given. If one of the DFAs is a Compact_DFA,
+    the others are converted and the result is a Compact_DFA.
+    """
+    if any(isinstance(dfa, Compact_DFA) for dfa in dfas):
+        dfas = [dfa if isinstance(dfa, Compact_DFA) else Compact_DFA.from_dict(dfa) for dfa in __ordered(dfas, order)]
+        return Compact_DFA.intersection(*dfas, stats = stats)
+    return __product(dfas, True, order, stats)
+
+
+@instrumented
+def union(*dfas, order = None, stats = None):
+    """Returns the union of the DFAs in input (see intersection for the keywords)."""
+    return __product(dfas, False, order, stats)
+
+
+@instrumented
 def complementation(dfa):
     """Returns the complement of the DFA in input."""
+    if isinstance(dfa, Compact_DFA):
+        return dfa.complementation()
     new_dfa = _rename(DFA.dfa_trimming(DFA.dfa_complementation(dfa)))
     new_dfa["alphabet"] = dfa["alphabet"]
     return new_dfa
 
 
+@instrumented
 def side(dfa, left = "", right = ""):
     """Returns the result of the corresponding side-hypothesis operation."""
+    if isinstance(dfa, Compact_DFA):
+        return dfa.side(left, right)
     dfa_copy = dfa.copy()
     dfa_copy["initial_state"] = __run(left, dfa_copy)
     finals = set()
@@ -48,17 +109,29 @@ def side(dfa, left = "", right = ""):
     return dfa_copy
 
 
+@instrumented
 def windows(dfa, period, lower_bound = 0, upper_bound = float("inf")):
     """Returns the result of the corresponding windows-cardinality operation."""
 
     dfa = unfold(dfa, period)
-
-    alphabet_dict = {}
-    for s in dfa["alphabet"]:
-        key = tuple(dfa["transitions"].get((q, s)) for q in dfa["states"])
-        alphabet_dict.setdefault(key, tuple())
-        alphabet_dict[key] += (s,)
-    alphabet_dict = {v[0]: v for v in alphabet_dict.values()}
+    alphabet_dict = symbol_classes(dfa)
+
+    # goto/failure table of the window prefixes (Aho-Corasick style)
+    run = {tuple(): dfa["initial_state"]}
+    fail = {tuple(): tuple()}
+    goto = {}
+
+    def follow(w, s):
+        if (w, s) not in goto:
+            q = dfa["transitions"].get((run[w], s)) if len(w) < period - 1 else None
+            if q is not None:
+                v = w + (s,)
+                run[v] = q
+                fail[v] = follow(fail[w], s) if w else tuple()
+            else:
+                v = follow(fail[w], s) if w else tuple()
+            goto[w, s] = v
+        return goto[w, s]
 
     new_dfa = __init_dfa(alphabet_dict.keys(), (tuple(), 0))
 
@@ -79,12 +152,10 @@ def windows(dfa, period, lower_bound = 0, upper_bound = float("inf")):
             )
         else:
             for s in new_dfa["alphabet"]:
-                v = (w + (s,))[1 - period :]
-                while __run(v, dfa) is None:
-                    v = v[1:]
+                v = follow(w, s)
                 if (
                     len(w) == period - 1
-                    and __run(w + (s,), dfa) in dfa["accepting_states"]
+                    and dfa["transitions"].get((run[w], s)) in dfa["accepting_states"]
                 ):
                     m = n + 1
                 else:
@@ -102,11 +173,61 @@ def windows(dfa, period, lower_bound = 0, upper_bound = float("inf")):
     return _rename(new_dfa)
 
 
-def periodic(dfa, period, binary_dfa = None):
-    """Returns the result of the corresponding periodic-composition operation."""
+def symbol_classes(*dfas, sequence = None):
+    """Returns the partition {representative: symbols} of the common alphabet of the DFAs in
+    input into the classes of symbols with the same transitions in every DFA (and, if a
+    sequence of sets of symbols is given, in the same sets of the sequence). A Timed_DFA
+    contributes the transitions of the DFAs it is built on."""
+    dfas = [part for dfa in dfas for part in (dfa.parts if isinstance(dfa, Timed_DFA) else (dfa,))]
+    alphabets = [set(dfa.symbols) if isinstance(dfa, Compact_DFA) else set(dfa["alphabet"]) for dfa in dfas]
+    columns = {s: [] for s in sorted(set.intersection(*alphabets), key = repr)}
+    for dfa in dfas:
+        if isinstance(dfa, Compact_DFA):
+            for j, s in enumerate(dfa.symbols):
+                if s in columns:
+                    columns[s].append(dfa.table[:, j].tobytes())
+        else:
+            transitions = defaultdict(list)
+            for (q, s), q2 in dfa["transitions"].items():
+                transitions[s].append((q, q2))
+            for s in columns:
+                columns[s].append(frozenset(transitions[s]))
+    if sequence is not None:
+        for s in columns:
+            columns[s].append(tuple(s in symbols for symbols in sequence))
+    classes = {}
+    for s, column in columns.items():
+        classes[tuple(column)] = classes.get(tuple(column), ()) + (s,)
+    return {symbols[0]: symbols for symbols in classes.values()}
+
+
+def compress(dfa, classes):
+    """Returns the DFA in input restricted to the representatives of the symbol classes."""
+    if isinstance(dfa, Timed_DFA):
+        return Timed_DFA(
+            dfa.alphabet & set(classes), dfa.initial_state, dfa.follow, dfa.accepting, dfa.period,
+            (dfa.key, tuple(classes)), tuple(compress(part, classes) for part in dfa.parts),
+        )
+    if isinstance(dfa, Compact_DFA):
+        return Compact_DFA(tuple(classes), dfa.table[:, dfa.codes(classes)], dfa.initial_state, dfa.accepting, dfa.names)
+    return {
+        "alphabet": set(classes),
+        "states": dfa["states"],
+        "initial_state": dfa["initial_state"],
+        "transitions": {(q, s): q2 for (q, s), q2 in dfa["transitions"].items() if s in classes},
+        "accepting_states": dfa["accepting_states"],
+    }
+
+
+@instrumented
+def periodic(dfa, period, binary_dfa = None, timed = False):
+    """Returns the result of the corresponding periodic-composition operation (as a Timed_DFA
+    without the position counter if timed)."""
 
     if not binary_dfa:
         binary_dfa = ones_dfa
+    if timed:
+        return __timed_periodic(dfa, period, binary_dfa)
     dfa = unfold(dfa, period)
     new_dfa = __init_dfa(
         dfa["alphabet"], (dfa["initial_state"], binary_dfa["initial_state"], 0)
@@ -144,8 +265,14 @@ def periodic(dfa, period, binary_dfa = None):
     return _rename(new_dfa)
 
 
-def mask(dfa, binary_mask):
-    """Returns the result of the corresponding periodic-mask operation."""
+@instrumented
+def mask(dfa, binary_mask, timed = False):
+    """Returns the result of the corresponding periodic-mask operation (as a Timed_DFA without
+    the position counter if timed or if dfa is a Timed_DFA)."""
+    if timed or isinstance(dfa, Timed_DFA):
+        return __timed_mask(dfa, binary_mask)
+    if isinstance(dfa, Compact_DFA):
+        return dfa.mask(binary_mask)
     new_dfa = __init_dfa(dfa["alphabet"], (dfa["initial_state"], 0))
 
     OPEN = {new_dfa["initial_state"]}
@@ -166,37 +293,393 @@ def mask(dfa, binary_mask):
                     OPEN.add(new_dfa["transitions"][state, s])
     return _rename(new_dfa)
 
+@instrumented
 def unfold(dfa, sequence):
     """Returns the corresponding unfolded DFA."""
+    if isinstance(dfa, Compact_DFA):
+        return dfa.unfold(sequence)
+    if isinstance(dfa, Timed_DFA):
+        return __unfold(
+            dfa.alphabet,
+            dfa.initial_state,
+            dfa.follow,
+            dfa.accepting,
+            [dfa.alphabet]*sequence if type(sequence) == int else sequence,
+        )
     if type(sequence) == int:
         sequence = [dfa["alphabet"]]*sequence
-    
+    return __unfold(
+        dfa["alphabet"],
+        dfa["initial_state"],
+        lambda q, s, t: dfa["transitions"].get((q, s)),
+        lambda q: q in dfa["accepting_states"],
+        sequence,
+    )
+
+@instrumented
+def unfold_intersection(sequence, *dfas):
+    """Returns the unfolded intersection of the DFAs in input, exploring only
+    the product states reached along the sequence."""
+    if isinstance(dfas[0], Compact_DFA):
+        return Compact_DFA.intersection(*dfas).unfold(sequence)
+    alphabet, initial_state, follow, accepting = __product_step(dfas, True)
+    if type(sequence) == int:
+        sequence = [alphabet]*sequence
+    period = lcm(*(dfa.period for dfa in dfas if isinstance(dfa, Timed_DFA)))
+    transitions = {}
+
+    def cached_follow(q, s, t):
+        if (q, s, t % period) not in transitions:
+            transitions[q, s, t % period] = follow(q, s, t)
+        return transitions[q, s, t % period]
+
+    return __unfold(alphabet, initial_state, cached_follow, accepting, sequence)
+
+def incremental_unfold(sequence, *dfas):
+    """Returns the Incremental_Unfold of the intersection of the DFAs in input along the sequence."""
+    alphabet, initial_state, follow, accepting = __product_step(dfas, True)
+    period = lcm(*(dfa.period for dfa in dfas if isinstance(dfa, Timed_DFA)))
+    transitions = {}
+
+    def cached_follow(q, s, t):
+        if (q, s, t % period) not in transitions:
+            transitions[q, s, t % period] = follow(q, s, t)
+        return transitions[q, s, t % period]
+
+    unfolding = Incremental_Unfold(alphabet, initial_state, cached_follow, accepting)
+    unfolding.update(sequence)
+    return unfolding
+
+
+class Timed_DFA:
+
+    def __init__(self, alphabet, initial_state, follow, accepting, period, key, parts):
+        """DFA whose transitions depend on the position t (from 0) of the symbol in the word: q reads s
+        at position t by follow(q, s, t) (None if rejected), which only depends on t modulo period. It
+        is only evaluated by unfold and unfold_intersection, where the day fixes the position. key
+        identifies its construction (see fingerprint) and parts are the DFAs it is built on."""
+        self.alphabet = set(alphabet)
+        self.initial_state = initial_state
+        self.follow = follow
+        self.accepting = accepting
+        self.period = period
+        self.key = sha1(repr(key).encode()).hexdigest()
+        self.parts = parts
+
+
+class Incremental_Unfold:
+
+    def __init__(self, alphabet, initial_state, follow, accepting):
+        """Layered graph of a DFA (given by its follow(q, s, t) and accepting functions) along a sequence that
+        can be extended or modified by update. As in unfold, the states of each layer are merged
+        backward, but a merged state is the frozenset of its original states, so that the merged
+        arcs of the layers whose partition did not change are kept as they are."""
+        self.alphabet = alphabet
+        self.initial_state = initial_state
+        self.follow = follow
+        self.accepting = accepting
+        self.sequence = []
+        self.layers = [{initial_state}]
+        self.arcs = []
+        self.classes = [{initial_state: frozenset({initial_state})} if accepting(initial_state) else {}]
+
+    def update(self, sequence):
+        """Moves the graph to the new sequence and returns the first layer whose arcs may have changed."""
+        if type(sequence) == int:
+            sequence = [self.alphabet]*sequence
+        sequence = [set(symbols) for symbols in sequence]
+        n = len(sequence)
+        old_sequence, old_layers, old_arcs, old_classes = self.sequence, self.layers, self.arcs, self.classes
+        first = next(
+            (t for t, (a, b) in enumerate(zip(sequence, old_sequence)) if a != b),
+            min(n, len(old_sequence)),
+        )
+
+        # expand forward from the first modified day, reusing the layers that did not change
+        layers, arcs = old_layers[:first + 1], old_arcs[:first]
+        for t in range(first, n):
+            if t < len(old_arcs) and sequence[t] == old_sequence[t] and layers[t] == old_layers[t]:
+                arcs.append(old_arcs[t])
+                layers.append(old_layers[t + 1])
+            else:
+                arcs.append({
+                    (q1, s): q2 for q1 in layers[t] for s in sequence[t]
+                    for q2 in [self.follow(q1, s, t)] if q2 is not None
+                })
+                layers.append(set(arcs[t].values()))
+        reused = next((t for t in range(n) if t >= len(old_arcs) or arcs[t] is not old_arcs[t]), n)
+
+        # validate and merge backward, down to the first layer whose partition did not change
+        final = frozenset(q for q in layers[n] if self.accepting(q))
+        classes = [None]*n + [{q: final for q in final}]
+        changed = 0
+        for t in range(n - 1, -1, -1):
+            if t < reused and classes[t + 1] == old_classes[t + 1]:
+                classes[:t + 1] = old_classes[:t + 1]
+                changed = t + 1
+                break
+            signatures = defaultdict(set)
+            for (q1, s), q2 in arcs[t].items():
+                if q2 in classes[t + 1]:
+                    signatures[q1].add((s, classes[t + 1][q2]))
+            groups = defaultdict(list)
+            for q, signature in signatures.items():
+                groups[frozenset(signature)].append(q)
+            classes[t] = {q: c for states in groups.values() for c in [frozenset(states)] for q in states}
+        self.sequence, self.layers, self.arcs, self.classes = sequence, layers, arcs, classes
+        return min(changed, n)
+
+    def merged_arcs(self, t):
+        """Returns the arcs (c1, s, c2) of layer t between merged states."""
+        classes, next_classes = self.classes[t], self.classes[t + 1]
+        return list(dict.fromkeys(
+            (classes[q1], s, next_classes[q2]) for (q1, s), q2 in self.arcs[t].items()
+            if q1 in classes and q2 in next_classes
+        ))
+
+
+class LRU_Cache:
+
+    def __init__(self, maxsize = 128):
+        """Bounded least-recently-used cache with hit/miss counters."""
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.data = OrderedDict()
+
+    def get(self, key, build):
+        """Returns the value stored at key, computing it with build() on a miss."""
+        if key in self.data:
+            self.hits += 1
+            self.data.move_to_end(key)
+            return self.data[key]
+        self.misses += 1
+        value = self.data[key] = build()
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last = False)
+        return value
+
+    def clear(self):
+        """Empties the cache and resets its counters."""
+        self.data.clear()
+        self.hits = self.misses = 0
+
+    def info(self):
+        """Returns the counters and the occupancy of the cache."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.data), "maxsize": self.maxsize}
+
+
+fingerprint_cache = LRU_Cache(1024)
+compact_cache = LRU_Cache(64)
+classes_cache = LRU_Cache(256)
+compress_cache = LRU_Cache(1024)
+intersection_cache = LRU_Cache(64)
+unfold_cache = LRU_Cache(512)
+
+
+def fingerprint(dfa):
+    """Returns the structural hash of the DFA, memoized (DFAs are assumed not to be modified in place),
+    or the key of a Timed_DFA."""
+    if isinstance(dfa, Timed_DFA):
+        return dfa.key
+    entry = fingerprint_cache.get(id(dfa), lambda: (dfa, structural_hash(compact(dfa))))
+    if entry[0] is not dfa:
+        entry = fingerprint_cache.data[id(dfa)] = (dfa, structural_hash(compact(dfa)))
+    return entry[1]
+
+
+def compact(dfa):
+    """Returns the Compact_DFA version of the DFA, memoized as fingerprint."""
+    if isinstance(dfa, Compact_DFA):
+        return dfa
+    entry = compact_cache.get(id(dfa), lambda: (dfa, Compact_DFA.from_dict(dfa)))
+    if entry[0] is not dfa:
+        entry = compact_cache.data[id(dfa)] = (dfa, Compact_DFA.from_dict(dfa))
+    return entry[1]
+
+
+def cached_intersection(*dfas):
+    """Returns the intersection of the DFAs in input as a Compact_DFA, memoized on their fingerprints."""
+    key = tuple(sorted(fingerprint(dfa) for dfa in dfas))
+    return intersection_cache.get(key, lambda: intersection(*[compact(dfa) for dfa in dfas]))
+
+
+def cached_symbol_classes(*dfas, sequence = None):
+    """Returns symbol_classes(*dfas, sequence = sequence): the classes of the DFAs are computed on their
+    Compact_DFA versions, memoized on their fingerprints and refined by the sequence."""
+    key = tuple(sorted(fingerprint(dfa) for dfa in dfas))
+    classes = classes_cache.get(key, lambda: symbol_classes(*[dfa if isinstance(dfa, Timed_DFA) else compact(dfa) for dfa in dfas]))
+    if sequence is None:
+        return classes
+    refined = {}
+    for members in classes.values():
+        parts = {}
+        for s in members:
+            signature = tuple(s in symbols for symbols in sequence)
+            parts[signature] = parts.get(signature, ()) + (s,)
+        refined.update((part[0], part) for part in parts.values())
+    return dict(sorted(refined.items(), key = lambda item: repr(item[0])))
+
+
+def cached_compress(dfa, classes):
+    """Returns compress(dfa, classes) (a Compact_DFA unless the DFA is a Timed_DFA), memoized on the
+    fingerprint of the DFA and the classes. The fingerprint of the result is derived from them instead
+    of being computed from the result."""
+    key = (fingerprint(dfa), tuple(classes.items()))
+
+    def build():
+        compressed = compress(dfa if isinstance(dfa, Timed_DFA) else compact(dfa), classes)
+        if not isinstance(compressed, Timed_DFA):
+            fingerprint_cache.get(id(compressed), lambda: (compressed, sha1(repr(key).encode()).hexdigest()))
+        return compressed
+
+    return compress_cache.get(key, build)
+
+
+def cached_unfold(sequence, *dfas):
+    """Returns the unfolded intersection of the DFAs in input, memoized on their fingerprints and the sequence.
+
+    The intersection is built once per set of rules (see cached_intersection) and unfolded along each
+    sequence. The rules are only unfolded together by unfold_intersection if one of them is a Timed_DFA."""
+    rules = tuple(sorted(fingerprint(dfa) for dfa in dfas))
+    key = (rules, sequence if type(sequence) == int else tuple(frozenset(s) for s in sequence))
+    if any(isinstance(dfa, Timed_DFA) for dfa in dfas):
+        return unfold_cache.get(key, lambda: unfold_intersection(
+            sequence, *[dfa.to_dict() if isinstance(dfa, Compact_DFA) else dfa for dfa in dfas]))
+    return unfold_cache.get(key, lambda: unfold(cached_intersection(*dfas), sequence).to_dict())
+
+
+def cache_info():
+    """Returns the counters of the automata caches."""
+    return {
+        "intersection": intersection_cache.info(),
+        "unfold": unfold_cache.info(),
+        "classes": classes_cache.info(),
+        "compress": compress_cache.info(),
+    }
+
+
+def clear_caches():
+    """Empties the automata caches."""
+    for cache in (fingerprint_cache, compact_cache, classes_cache, compress_cache, intersection_cache, unfold_cache):
+        cache.clear()
+
+
+def __product(dfas, conjunctive, order, stats):
+    if any(isinstance(dfa, Timed_DFA) for dfa in dfas):
+        raise ValueError("a Timed_DFA can only be unfolded")
+    dfas = __ordered(dfas, order)
+    alphabet, initial_state, follow, accepting = __product_step(dfas, conjunctive)
+
+    new_dfa = __init_dfa(alphabet, initial_state)
+    new_dfa["states"].add(initial_state)
+    OPEN = [initial_state]
+    while OPEN:
+        state = OPEN.pop()
+        if accepting(state):
+            new_dfa["accepting_states"].add(state)
+        for s in alphabet:
+            next_state = follow(state, s)
+            if next_state is not None:
+                new_dfa["transitions"][state, s] = next_state
+                if next_state not in new_dfa["states"]:
+                    new_dfa["states"].add(next_state)
+                    OPEN.append(next_state)
+    if stats is not None:
+        stats["peak_states"] = len(new_dfa["states"])
+
+    live = __co_reachable(new_dfa) | {initial_state}
+    new_dfa["states"] &= live
+    new_dfa["transitions"] = {
+        k: v for k, v in new_dfa["transitions"].items() if k[0] in live and v in live
+    }
+    if stats is not None:
+        stats["states"] = len(new_dfa["states"])
+        stats["transitions"] = len(new_dfa["transitions"])
+    return _rename(new_dfa)
+
+
+def __ordered(dfas, order):
+    def size(dfa):
+        if isinstance(dfa, Compact_DFA):
+            return dfa.n_states, dfa.n_transitions, len(dfa.symbols)
+        return len(dfa["states"]), len(dfa["transitions"]), len(dfa["alphabet"])
+
+    if order == "size":
+        return sorted(dfas, key = lambda dfa: size(dfa)[0])
+    if order == "selectivity":
+        return sorted(dfas, key = lambda dfa: size(dfa)[1] / max(1, size(dfa)[0] * size(dfa)[2]))
+    if order is not None:
+        raise ValueError("order has to be either None, 'size' or 'selectivity'")
+    return list(dfas)
+
+
+def __product_step(dfas, conjunctive):
+    alphabets = [dfa.alphabet if isinstance(dfa, Timed_DFA) else set(dfa["alphabet"]) for dfa in dfas]
+    if conjunctive:
+        alphabet = set.intersection(*alphabets)
+    else:
+        alphabet = set.union(*alphabets)
+    # the follow functions of the Timed_DFAs reject the dead states themselves
+    lives = [None if isinstance(dfa, Timed_DFA) else __co_reachable(dfa) for dfa in dfas]
+
+    def follow(state, s, t = None):
+        next_state = []
+        for dfa, live, q in zip(dfas, lives, state):
+            if q is not None:
+                q = dfa.follow(q, s, t) if live is None else dfa["transitions"].get((q, s))
+            if q is None or (live is not None and q not in live):
+                if conjunctive:
+                    return None
+                q = None
+            next_state.append(q)
+        if not conjunctive and next_state.count(None) == len(next_state):
+            return None
+        return tuple(next_state)
+
+    def accepting(state):
+        accepted = [
+            q is not None and (dfa.accepting(q) if isinstance(dfa, Timed_DFA) else q in dfa["accepting_states"])
+            for dfa, q in zip(dfas, state)
+        ]
+        return all(accepted) if conjunctive else any(accepted)
+
+    initial_state = tuple(
+        dfa.initial_state if live is None else dfa["initial_state"] if dfa["initial_state"] in live else None
+        for dfa, live in zip(dfas, lives)
+    )
+    return alphabet, initial_state, follow, accepting
+
+
+def __unfold(alphabet, initial_state, follow, accepting, sequence):
     # initialize
     n = len(sequence)
-    current_layer = {dfa["initial_state"]}
+    current_layer = {initial_state}
     children = [defaultdict(set) for _ in range(n)]
 
     # expand forward
     for i in range(n):
         next_layer = set()
-        for q1,s in [(q,s) for q,s in product(current_layer,sequence[i]) if (q,s) in dfa["transitions"]]:
-            q2 = dfa["transitions"][q1,s]
-            children[i][q1].add((s,q2))
-            next_layer.add(q2)
+        for q1 in current_layer:
+            for s in sequence[i]:
+                q2 = follow(q1, s, i)
+                if q2 is not None:
+                    children[i][q1].add((s,q2))
+                    next_layer.add(q2)
         current_layer = next_layer
 
     # filter and merge last layer
-    final_states = tuple(current_layer.intersection(dfa["accepting_states"]))
+    final_states = tuple(q for q in current_layer if accepting(q))
     new_state = {q:final_states for q in final_states}
     if not new_state:
         return  {
-            "alphabet": dfa["alphabet"],
+            "alphabet": alphabet,
             "states": {1},
             "initial_state": 1,
             "transitions": {},
             "accepting_states": {},
         }
-    
+
     # validate backward
     delta = {}
     for i in range(n-1,-1,-1):
@@ -217,14 +700,82 @@ def unfold(dfa, sequence):
                 del children[i][q]
 
     unfolded = {
-            "alphabet": dfa["alphabet"],
+            "alphabet": alphabet,
             "states": {(i,q) for i,c in enumerate(children) for q in c}.union({(n,final_states)}),
-            "initial_state": (0,(dfa["initial_state"],)),
+            "initial_state": (0,(initial_state,)),
             "transitions": delta,
             "accepting_states": {(n,final_states)},
         }
     return _rename(unfolded)
 
+
+def __timed_periodic(dfa, period, binary_dfa):
+    if isinstance(dfa, Compact_DFA):
+        dfa = dfa.to_dict()
+    transitions, live = dfa["transitions"], __co_reachable(dfa)
+    binary_transitions = binary_dfa["transitions"]
+
+    def follow(state, s, t):
+        q, q_01 = state
+        next_q = transitions.get((q, s))
+        if next_q not in live:
+            next_q = None
+        if t % period == period - 1:
+            s_01 = "1" if next_q in dfa["accepting_states"] else "0"
+            next_q_01 = binary_transitions.get((q_01, s_01))
+            return None if next_q_01 is None else (dfa["initial_state"], next_q_01)
+        # a dead inner DFA is kept alive (None): an incomplete last period is not checked
+        return next_q, q_01
+
+    return Timed_DFA(
+        dfa["alphabet"],
+        (dfa["initial_state"], binary_dfa["initial_state"]),
+        follow,
+        lambda state: state[1] in binary_dfa["accepting_states"],
+        period,
+        ("periodic", fingerprint(dfa), period, fingerprint(binary_dfa)),
+        (dfa,),
+    )
+
+
+def __timed_mask(dfa, binary_mask):
+    if isinstance(dfa, Compact_DFA):
+        dfa = dfa.to_dict()
+    length, ones = len(binary_mask), binary_mask.count("1")
+    before = [binary_mask[:l].count("1") for l in range(length)]
+    if isinstance(dfa, Timed_DFA):
+        # the inner position is the number of masked-in positions before t
+        inner, accepting, parts = dfa.follow, dfa.accepting, dfa.parts
+        period = length*dfa.period//gcd(ones, dfa.period)
+        initial_state, alphabet = dfa.initial_state, dfa.alphabet
+    else:
+        transitions, live = dfa["transitions"], __co_reachable(dfa)
+        inner = lambda q, s, t: transitions.get((q, s)) if transitions.get((q, s)) in live else None
+        accepting, period, parts = (lambda q: q in dfa["accepting_states"]), length, (dfa,)
+        initial_state, alphabet = dfa["initial_state"], dfa["alphabet"]
+
+    def follow(q, s, t):
+        l = t % length
+        if binary_mask[l] == "0":
+            return q
+        return inner(q, s, t // length * ones + before[l])
+
+    return Timed_DFA(alphabet, initial_state, follow, accepting, period, ("mask", fingerprint(dfa), binary_mask), parts)
+
+
+def __co_reachable(dfa):
+    predecessors = defaultdict(set)
+    for (q1, _), q2 in dfa["transitions"].items():
+        predecessors[q2].add(q1)
+    live = set(dfa["accepting_states"])
+    OPEN = list(live)
+    while OPEN:
+        for q in predecessors[OPEN.pop()].difference(live):
+            live.add(q)
+            OPEN.append(q)
+    return live
+
+
 def __init_dfa(alphabet, initial_state):
     return {
         "alphabet": alphabet,
@@ -246,6 +797,8 @@ def __run(word, dfa, state=None):
 
 
 def _rename(dfa):
+    if isinstance(dfa, Compact_DFA):
+        return dfa.renamed()
     Q = {dfa["initial_state"]: 1}
     Q.update(
         {
@@ -1,60 +1,75 @@
-from bisect import bisect
-from collections import defaultdict
+from fractions import Fraction
 from itertools import product
-from regular_scheduling.operations import intersection,complementation,_rename
+from math import ceil,floor,gcd,lcm
+import numpy as np
+from regular_scheduling.operations import minimize,_rename
+from regular_scheduling.instrumentation import instrumented
 
-def cardinality(symbols,lower_bounds = tuple(),upper_bounds = tuple()):
-    """ Return the corresponding cardinality rule."""
+@instrumented
+def cardinality(symbols,lower_bounds = tuple(),upper_bounds = tuple(),length = None,minimal = False):
+    """ Return the corresponding cardinality rule.
+
+    Only the counters reachable from the initial state are built. If length is
+    given, the rule is only exact on the words of at most length symbols (e.g.
+    for windows of that period): the states are explored up to that depth and
+    the upper bounds that cannot be exceeded are dropped. If minimal, the
+    minimal DFA is returned."""
     symbols = [tuple(k) if type(k)!=str else (k,) for k in symbols]
     if not lower_bounds:
         lower_bounds = tuple([0]*len(symbols))
     if not upper_bounds:
         upper_bounds = tuple([float("inf")]*len(symbols))
-    lower = {k:lower_bounds[i] for i,k in enumerate(symbols)}
-    upper = {k:upper_bounds[i] for i,k in enumerate(symbols)}  
-    maxi = {k:v if v<float("inf") else lower[k] for k,v in upper.items()}
-    states = set(product(*[range(v+1) for v in maxi.values()]))
-    transitions = {(q,s):q[:i] + (int(q[i]+int(q[i] < maxi[k])),) + q[i+1:]
-                  for q in states for i,(k,v) in enumerate(upper.items()) for s in k if q[i]<v}
-    finals = set(product(*[range(v,maxi[k]+1) for k,v in lower.items()]))
-    dfa = {"alphabet"         :set(s for k in symbols for s in k),
-           "states"           :states,
-           "initial_state"    :tuple([0]*len(lower)),
-           "transitions"      :transitions,
-           "accepting_states" :finals}
-    
-    return _rename(dfa)
+    if length is not None:
+        upper_bounds = tuple(u if u < length else float("inf") for u in upper_bounds)
+    counter = {s:i for i,k in enumerate(symbols) for s in k}
+    maxi = [u if u<float("inf") else lower_bounds[i] for i,u in enumerate(upper_bounds)]
+
+    def follow(q,s):
+        i = counter[s]
+        if q[i] >= upper_bounds[i]:
+            return None
+        return q[:i] + (q[i]+int(q[i] < maxi[i]),) + q[i+1:]
+
+    def accepting(q):
+        return all(m >= lower_bounds[i] for i,m in enumerate(q))
+
+    dfa = __explore(set(counter),tuple([0]*len(symbols)),follow,accepting,length)
+    return minimize(dfa) if minimal else _rename(dfa)
 
-def stretch(symbols,lower_bounds = tuple(),upper_bounds = tuple()):
-    """ Return the corresponding stretch rule."""
+@instrumented
+def stretch(symbols,lower_bounds = tuple(),upper_bounds = tuple(),length = None,minimal = False):
+    """ Return the corresponding stretch rule (see cardinality for the keywords)."""
     symbols = [tuple(k) if type(k)!=str else (k,) for k in symbols]
     if not lower_bounds:
         lower_bounds = tuple([1]*len(symbols))
     if not upper_bounds:
         upper_bounds = tuple([float("inf")]*len(symbols))
-    bounded_idx,unbounded_idx = [],[]
-    for i,l in enumerate(lower_bounds):
-        if (l,upper_bounds[i]) != (1,float("inf")):
-            bounded_idx.append(i)
-        else:
-            unbounded_idx.append(i)
-    lower = {symbols[i]:lower_bounds[i] for i in bounded_idx}
-    upper = {symbols[i]:upper_bounds[i] for i in bounded_idx} 
+    if length is not None:
+        upper_bounds = tuple(u if u < length else float("inf") for u in upper_bounds)
+    bounded = {k for i,k in enumerate(symbols) if (lower_bounds[i],upper_bounds[i]) != (1,float("inf"))}
+    group = {s:k for k in symbols for s in k}
+    lower = {k:lower_bounds[i] for i,k in enumerate(symbols)}
+    upper = {k:upper_bounds[i] for i,k in enumerate(symbols)}
     maxi = {k:v if v<float("inf") else lower[k] for k,v in upper.items()}
-    states = set((k,m) for k,v in maxi.items() for m in range(1,v+1)).union({(("",),0)})
-    finals = set((k,m) for k,v in maxi.items() for m in range(lower[k],v+1)).union({(("",),0)})
-    transitions = {**{((k1,m),s):(k2,m*(k1==k2)+int(m*(k1==k2)<v))
-                      for k1,m in states for k2,v in maxi.items() for s in k2
-                      if ((m*(k1==k2) < upper[k2]) and (((k1,m) in finals) or (k1==k2)))},
-                   **{((("",),0),s):(("",),0) for i in unbounded_idx for s in symbols[i]},
-                   **{(q,s):(("",),0) for i in unbounded_idx for s in symbols[i] for q in finals}}
-    dfa = {"alphabet"         :set(s for k in symbols for s in k),
-           "states"           :states,
-           "initial_state"    :(("",),0),
-           "transitions"      :transitions,
-           "accepting_states" :finals}
-    return _rename(dfa)
+    initial_state = (("",),0)
 
+    def accepting(q):
+        return q == initial_state or lower[q[0]] <= q[1]
+
+    def follow(q,s):
+        k1,m = q
+        k2 = group[s]
+        if k2 not in bounded:
+            return initial_state if accepting(q) else None
+        m = m*(k1 == k2)
+        if m >= upper[k2] or not (accepting(q) or k1 == k2):
+            return None
+        return (k2,m+int(m < maxi[k2]))
+
+    dfa = __explore(set(group),initial_state,follow,accepting,length)
+    return minimize(dfa) if minimal else _rename(dfa)
+
+@instrumented
 def pattern(symbols,sequence,lower_bounds = tuple(),upper_bounds = tuple()):
     """ Return the corresponding patterned-stretch rule."""
     symbols = [tuple(k) if type(k)!=str else (k,) for k in symbols]
@@ -75,70 +90,89 @@ def pattern(symbols,sequence,lower_bounds = tuple(),upper_bounds = tuple()):
            "accepting_states" :finals}
     return _rename(dfa)
 
+@instrumented
 def knapsack(symbols,weights,lower_bound = 0,upper_bound = float("inf")):
-    """ Return the corresponding knapsack rule."""
+    """ Return the corresponding (minimal) knapsack rule."""
     symbols = [tuple(k) if type(k)!=str else (k,) for k in symbols]
-    if lower_bound == 0:
-        if upper_bound == float("inf"):
-            return __universal(symbols)
-        return __knapsack(symbols,weights,upper_bound)
-    return intersection(
-                    __knapsack(symbols,weights,upper_bound),
-                    complementation(__knapsack(symbols,weights,lower_bound-1e-10)))
+    if lower_bound <= 0 and upper_bound == float("inf"):
+        return __universal(symbols)
+    return __knapsack(symbols,*__integral(weights,lower_bound,upper_bound))
+
+def __explore(alphabet,initial_state,follow,accepting,length):
+    # breadth-first construction of the states reachable from the initial state (in at most length steps)
+    dfa = {"alphabet":alphabet,"states":{initial_state},"initial_state":initial_state,"transitions":{},"accepting_states":set()}
+    layer,depth = [initial_state],0
+    while layer and (length is None or depth < length):
+        next_layer = []
+        for q in layer:
+            for s in alphabet:
+                q2 = follow(q,s)
+                if q2 is not None:
+                    dfa["transitions"][q,s] = q2
+                    if q2 not in dfa["states"]:
+                        dfa["states"].add(q2)
+                        next_layer.append(q2)
+        layer,depth = next_layer,depth+1
+    dfa["accepting_states"] = set(q for q in dfa["states"] if accepting(q))
+    return dfa
 
 def __universal(symbols):
     symbols = [tuple(k) if type(k)!=str else (k,) for k in symbols]
     return {"alphabet"         :set(s for k in symbols for s in k),
             "states"           :{0},
-            "initial_state"    :{0},
+            "initial_state"    :0,
             "transitions"      :{(0,s):0 for k in symbols for s in k},
             "accepting_states" :{0}}
 
-def __knapsack(symbols,weights,upper_bound):
-    sorted_weights = sorted(set(weights).difference({0}))
-    OPEN,CLOSED,MAX = [0],[],defaultdict(int)
-    max_i = len(sorted_weights)
-    while max_i > 0:
-        q1 = OPEN.pop(0)
-        CLOSED.append(q1)
-        MAX[q1] = 1
-        while MAX[q1] <= max_i:
-            q2 = round(q1+sorted_weights[MAX[q1]-1],5)
-            if q2 <= upper_bound:
-                i = bisect(OPEN,q2)
-                if i == 0 or OPEN[i-1] != q2:
-                    OPEN.insert(i,q2)
-                MAX[q1] += 1
-            else:
-                max_i = MAX[q1]-1
-        MAX[q1] = max_i
-    states,CLASS = set(),{}    
-    last_merge,current_class = sorted_weights[0],CLOSED.pop()
-    OPEN.append(current_class)
-    CLASS = {q:current_class for q in OPEN}
-    while round(current_class+sorted_weights[0],5) > last_merge:
-        sigma = CLOSED.pop()
-        i = 0
-        if MAX[sigma] == MAX[current_class]:
-            while i < MAX[sigma]:
-                i += 1
-                if CLASS[round(current_class+sorted_weights[i-1],5)] !=CLASS[round(sigma+sorted_weights[i-1],5)]:
-                    i = MAX[sigma]+1
-        if i == MAX[sigma]:
-            last_merge = sigma
-            OPEN.append(sigma)
-        else:
-            current_class = sigma
-            states.add(tuple(OPEN))
-            OPEN = [sigma]
-        CLASS[sigma] = current_class
-    states.update([tuple(OPEN)]+[(q,) for q in CLOSED])
-    CLASS = {sigma:q for q in states for sigma in q}
-    transitions = {(q,s):CLASS[round(q[0]+weights[i],5)] for q in states
-                   for i,S in enumerate(symbols) for s in tuple(S)
-                   if weights[i] <= ([0]+sorted_weights)[MAX[q[0]]]}
-    return {"alphabet":         set(s for S in symbols for s in tuple(S)),
-            "states":           states,
-            "initial_state":    (0,),
+def __integral(weights,lower_bound,upper_bound):
+    # weights (and bounds) scaled to integers and divided by their GCD
+    fractions = [Fraction(w).limit_denominator(10**5) for w in weights]
+    scale = lcm(*[f.denominator for f in fractions])
+    weights = [int(f*scale) for f in fractions]
+    divisor = gcd(*weights) or 1
+    lower = max(0,ceil(Fraction(lower_bound).limit_denominator(10**5)*scale/divisor))
+    upper = floor(Fraction(upper_bound).limit_denominator(10**5)*scale/divisor) if upper_bound < float("inf") else None
+    return [w//divisor for w in weights],lower,upper
+
+def __knapsack(symbols,weights,lower,upper):
+    # the states are the reachable sums (saturated at lower if there is no upper bound); the residual
+    # language of a sum s only depends on the reachable sums in [lower-s, upper-s], i.e. on the first
+    # and last of them, which gives the classes of the minimal DFA directly
+    cap = upper if upper is not None else lower
+    weights = np.array(weights,dtype = np.int64)
+    reachable = np.zeros(cap+1,dtype = bool)
+    reachable[0] = True
+    for w in set(weights[(weights > 0) & (weights <= cap)].tolist()):
+        padded = np.zeros(-(-(cap+1)//w)*w,dtype = bool)
+        padded[:cap+1] = reachable
+        reachable = np.logical_or.accumulate(padded.reshape(-1,w),axis = 0).reshape(-1)[:cap+1]
+    index = np.arange(cap+1)
+    none = cap+2 if upper is None and not (weights > 0).any() else cap+1
+    previous = np.maximum.accumulate(np.where(reachable,index,-1))
+    following = np.append(np.minimum.accumulate(np.where(reachable,index,none)[::-1])[::-1],none)
+
+    sums = np.flatnonzero(reachable)
+    if upper is None:
+        sums = np.union1d(sums,[cap]) if (sums+weights.max(initial = 0) >= cap).any() else sums
+        keys = np.stack([following[np.clip(lower-sums,0,cap+1)],np.zeros_like(sums)],axis = 1)
+        live = keys[:,0] <= cap+1
+        targets = np.minimum(sums[:,None]+weights[None,:],cap)
+    else:
+        keys = np.stack([following[np.clip(lower-sums,0,cap+1)],previous[upper-sums]],axis = 1)
+        live = keys[:,0] <= keys[:,1]
+        targets = sums[:,None]+weights[None,:]
+    position = np.full(cap+1,-1)
+    position[sums[live]] = np.arange(np.count_nonzero(live))
+    sums,keys,targets = sums[live],keys[live],targets[live]
+    if not len(sums) or sums[0] != 0:
+        return {"alphabet":set(s for S in symbols for s in S),"states":{0},"initial_state":0,"transitions":{},"accepting_states":set()}
+    classes = np.unique(keys,axis = 0,return_inverse = True)[1].reshape(-1)
+    targets = np.where(targets <= cap,position[np.minimum(targets,cap)],-1)
+    rows,cols = np.nonzero(targets >= 0)
+    heads = classes[targets[rows,cols]].tolist()
+    transitions = {(q,s):q2 for q,i,q2 in zip(classes[rows].tolist(),cols.tolist(),heads) for s in symbols[i]}
+    return {"alphabet":         set(s for S in symbols for s in S),
+            "states":           set(classes.tolist()),
+            "initial_state":    int(classes[0]),
             "transitions":      transitions,
-            "accepting_states": states.copy()}
\ No newline at end of file
+            "accepting_states": set(classes[keys[:,0] == 0].tolist())}
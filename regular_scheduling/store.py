@@ -0,0 +1,134 @@
+"""Persistent, content-addressed store of the compiled contract rules.
+
+The rules of a contract only depend on its definition in offline.json (and on
+the shifts), so they are compiled once, e.g. by a nightly job
+
+    python -m regular_scheduling.store rules/ data/Instance1 data/Instance2 --intersect
+
+and loaded by the online phase:
+
+    r, dfas = Rule_Store("rules/").rules(data, intersect = True)
+
+Each contract is stored in the directory named after the sha1 of its
+definition. Each automaton is one .npy int32 array (the transition table with
+the accepting mask as last column, initial state 0) that is memory-mapped on
+load, and meta.json holds the symbols of the automata.
+"""
+import argparse
+import json
+import os
+from hashlib import sha1
+
+import numpy as np
+
+from regular_scheduling.compact import Compact_DFA
+from regular_scheduling.contracts import rules, parallel_rules
+
+FORMAT = 1
+
+
+def contract_key(data, g):
+    """Returns the sha1 of the definition of contract g (see offline data)."""
+    definition = {
+        "format": FORMAT,
+        "Sigma": sorted(data["Sigma"]),
+        "o": data["o"],
+        "tau": data["tau"],
+        "F": {s: sorted(F) for s, F in data["F"][g].items()},
+        **{k: data[k][g] for k in ("gamma_max", "gamma_min", "delta_min", "nu_max", "tau_max", "rho_max")},
+    }
+    return sha1(json.dumps(definition, sort_keys = True).encode()).hexdigest()
+
+
+class Rule_Store:
+
+    def __init__(self, path):
+        """Store of compiled rules in the directory path."""
+        self.path = path
+        os.makedirs(path, exist_ok = True)
+
+    def get(self, key):
+        """Returns the memory-mapped automata {name: Compact_DFA} stored at key, or None."""
+        directory = os.path.join(self.path, key)
+        if not os.path.exists(os.path.join(directory, "meta.json")):
+            return None
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        dfas = {}
+        for name, symbols in meta["symbols"].items():
+            array = np.load(os.path.join(directory, name + ".npy"), mmap_mode = "r")
+            dfas[name] = Compact_DFA(symbols, array[:, :-1], 0, array[:, -1] > 0)
+        return dfas
+
+    def put(self, key, dfas):
+        """Stores the automata {name: dfa} at key (meta.json is written last, so
+        that an interrupted write is ignored by get)."""
+        directory = os.path.join(self.path, key)
+        os.makedirs(directory, exist_ok = True)
+        symbols = {}
+        for name, dfa in dfas.items():
+            if not isinstance(dfa, Compact_DFA):
+                dfa = Compact_DFA.from_dict(dfa)
+            dfa = dfa.renamed()
+            np.save(os.path.join(directory, name + ".npy"), np.hstack([dfa.table, dfa.accepting[:, None]]).astype(np.int32))
+            symbols[name] = list(dfa.symbols)
+        with open(os.path.join(directory, "meta.tmp"), "w") as f:
+            json.dump({"format": FORMAT, "symbols": symbols}, f)
+        os.replace(os.path.join(directory, "meta.tmp"), os.path.join(directory, "meta.json"))
+
+    def __complete(self, key, intersect):
+        dfas = self.get(key)
+        return dfas is not None and (not intersect or "intersection" in dfas)
+
+    def populate(self, data, processes = None, intersect = False, minimize = False):
+        """Compiles and stores the rules of the contracts of the offline data that
+        are missing from the store, and returns the number of compiled contracts."""
+        keys = {g: contract_key(data, g) for g in data["G"]}
+        missing = {g for g, key in keys.items() if not self.__complete(key, intersect)}
+        if not missing:
+            return 0
+        compiled = parallel_rules({**data, "G": missing}, processes, intersect)
+        r, dfas = compiled if intersect else (compiled, {})
+        for g in missing:
+            stored = {str(i): dfa for i, dfa in r[g].items()}
+            if g in dfas:
+                stored["intersection"] = dfas[g]
+            if minimize:
+                stored = {name: Compact_DFA.from_dict(dfa).minimized() for name, dfa in stored.items()}
+            self.put(keys[g], stored)
+        return len(missing)
+
+    def rules(self, data, intersect = False, compact = False):
+        """Returns the rules {g: {i: dfa}} of the contracts of the offline data (and
+        the intersections {g: dfa} if intersect), compiling the missing ones.
+
+        The automata are returned as dicts, or as the memory-mapped Compact_DFA
+        if compact.
+        """
+        self.populate(data, intersect = intersect)
+        stored = {g: self.get(contract_key(data, g)) for g in data["G"]}
+        convert = (lambda dfa: dfa) if compact else Compact_DFA.to_dict
+        r = {g: {i: convert(dfas[str(i)]) for i in rules} for g, dfas in stored.items()}
+        if intersect:
+            return r, {g: convert(dfas["intersection"]) for g, dfas in stored.items()}
+        return r
+
+
+def main():
+    from data.parsing import offline
+
+    parser = argparse.ArgumentParser(description = "Compiles the rules of the contracts of the instances into a store.")
+    parser.add_argument("store")
+    parser.add_argument("instances", nargs = "+")
+    parser.add_argument("--processes", type = int)
+    parser.add_argument("--intersect", action = "store_true", help = "also store the intersection of the rules of each contract")
+    parser.add_argument("--minimize", action = "store_true", help = "store the minimal automata")
+    args = parser.parse_args()
+
+    store = Rule_Store(args.store)
+    for instance in args.instances:
+        print(instance, store.populate(offline(instance), args.processes, args.intersect, args.minimize), "contract(s) compiled", flush = True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import itertools
+import random
+
+import numpy as np
+import pytest
+
+from regular_scheduling.compact import Compact_DFA
+
+
+def random_dfa(rng, n, symbols = "abc"):
+    return {
+        "alphabet": set(symbols),
+        "states": set(range(n)),
+        "initial_state": 0,
+        "accepting_states": {q for q in range(n) if rng.random() < 0.3},
+        "transitions": {(q, s): rng.randrange(n) for q in range(n) for s in symbols if rng.random() < 0.8},
+    }
+
+
+def language(dfa, length, initial_state = None):
+    """The acceptance flags of all the words of up to length symbols (by length, then lexicographically)."""
+    if initial_state is not None:
+        dfa = Compact_DFA(dfa.symbols, dfa.table, initial_state, dfa.accepting)
+    flags = [dfa.accepting[dfa.initial_state]]
+    for l in range(1, length+1):
+        words = np.array(list(itertools.product(range(len(dfa.symbols)), repeat = l)))
+        flags.extend(dfa.run(words)[0])
+    return tuple(bool(flag) for flag in flags)
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_minimized_matches_brute_force(seed):
+    rng = random.Random(seed)
+    dfa = Compact_DFA.from_dict(random_dfa(rng, rng.randint(1, 8)))
+    minimal = dfa.minimized()
+    assert language(minimal, 6) == language(dfa, 6)
+
+    # as many states as distinct residual languages of the useful states (words of up to n symbols tell them apart)
+    trimmed = dfa.trimmed()
+    if trimmed.accepting.any():
+        residuals = {language(trimmed, trimmed.n_states, q) for q in range(trimmed.n_states)}
+        assert minimal.n_states == len(residuals)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_minimized_of_equivalent_dfas(seed):
+    # a copy of every state, reached from the first copy: same language, twice as many states
+    rng = random.Random(seed)
+    dfa = random_dfa(rng, 6)
+    n = len(dfa["states"])
+    doubled = {
+        "alphabet": dfa["alphabet"],
+        "states": set(range(2*n)),
+        "initial_state": 0,
+        "accepting_states": dfa["accepting_states"] | {q+n for q in dfa["accepting_states"]},
+        "transitions": {**{(q, s): q2+n for (q, s), q2 in dfa["transitions"].items()},
+                        **{(q+n, s): q2 for (q, s), q2 in dfa["transitions"].items()}},
+    }
+    assert Compact_DFA.from_dict(doubled).minimized().digest() == Compact_DFA.from_dict(dfa).minimized().digest()
@@ -0,0 +1,94 @@
+import random
+from collections import Counter
+
+import pytest
+from docplex.mp.relax_linear import LinearRelaxer
+
+from benchmarks.formulations import formulations
+from data.parsing import offline, online
+from regular_scheduling.contracts import contract_rules, regular_rules
+from regular_scheduling.mip_regular import Regular_Model
+from regular_scheduling.operations import accepts
+
+
+@pytest.fixture(scope = "module")
+def instance1():
+    data = {**offline("./data/Instance1"), **online("./data/Instance1")}
+    g = sorted(data["G"])[0]
+    return data, g, contract_rules(data, g)
+
+
+def rolling_model(data, rules, sequence):
+    T, Sigma, o = data["T"], data["Sigma"], data["o"]
+    rng = random.Random(0)
+    mip = Regular_Model()
+    x = mip.binary_var_dict(((t, s) for t in range(1, T+1) for s in sorted(Sigma.difference({o}))), name = "x")
+    regular_ct = mip.add_rolling_regular_constraint(x, 1, sequence, *rules.values(), ctname = "flow")
+    mip.minimize(mip.sum(rng.randint(-3, 3)*v for v in x.values()))
+    return mip, x, regular_ct
+
+
+def test_repeated_updates_match_fresh_build(instance1):
+    data, g, rules = instance1
+    T, Sigma, o = data["T"], data["Sigma"], data["o"]
+    sequence = lambda days_off: [{o} if t in days_off else Sigma for t in range(1, T+1)]
+    mip, x, regular_ct = rolling_model(data, rules, sequence(set()))
+    for days_off in [{5}, {5, 9}, {9}, {2, 9, 12}, set()]:
+        # several updates of the same handle, without solving in between
+        mip.update_regular_constraint(regular_ct, x, sequence(days_off - {9}))
+        mip.update_regular_constraint(regular_ct, x, sequence(days_off))
+        fresh = rolling_model(data, rules, sequence(days_off))[0]
+        assert mip.solve().objective_value == pytest.approx(fresh.solve().objective_value)
+        fresh.end()
+
+
+@pytest.fixture(scope = "module")
+def models1():
+    data = offline("./data/Instance1")
+    versions = {version: {**data, **online("./data/Instance1", version)} for version in ("personalized", "anonymous")}
+    return versions, regular_rules(data)
+
+
+def solved(models1, name):
+    versions, r = models1
+    data = versions["anonymous" if name.startswith("A-RB-MIP") else "personalized"]
+    mip = formulations[name](data, r)
+    relaxed = LinearRelaxer.make_relaxed_model(mip)
+    bound = relaxed.solve().objective_value
+    relaxed.end()
+    mip.solve()
+    return data, mip, bound
+
+
+@pytest.mark.parametrize("name", ["P-RB-MIP classes", "P-RB-MIP presolve", "P-RB-MIP classes presolve",
+                                  "A-RB-MIP classes presolve", "G-RB-MIP classes presolve"])
+def test_options_keep_objectives(models1, name):
+    """The symbol classes and the presolve of the layered graphs change neither the LP nor the IP objective."""
+    _, plain, plain_bound = solved(models1, name.split()[0])
+    _, reduced, reduced_bound = solved(models1, name)
+    assert reduced_bound == pytest.approx(plain_bound)
+    assert reduced.objective_value == pytest.approx(plain.objective_value)
+    plain.end()
+    reduced.end()
+
+
+@pytest.mark.parametrize("name", ["P-RB-MIP", "P-RB-MIP classes presolve", "A-RB-MIP classes presolve",
+                                  "G-RB-MIP", "G-RB-MIP classes presolve"])
+def test_decoded_words_match_solution(models1, name):
+    """The words decoded from the flows (_decompose, then _expand for the symbol classes) are accepted by the rules,
+    keep the days-off and add up to the x of the solution."""
+    _, r = models1
+    data, mip, _ = solved(models1, name)
+    o, O = data["o"], data["O"]
+    contract = {e: g for g, members in data["E"].items() for e in members}
+    for handle in mip.regular_constraints:
+        # "flow " followed by the employee, the contract or the members (joined by +) of the handle
+        unit = handle.ctname[len("flow "):].split("+")[0]
+        rows, words = mip.get_regular_solutions(handle)
+        assert len(rows) == handle.number
+        assert accepts([list(word) for word in words], *r[contract.get(unit, unit)].values())[0].all()
+        assert all(word[t-1] == o for word in words for t in O.get(unit, ()))
+        counts = Counter((t+1, s) for word in words for t, s in enumerate(word) if s != o)
+        values = mip.solution.get_value_dict(handle.x, keep_zeros = False)
+        assert counts == Counter({key: round(value) for key, value in values.items()})
+    mip.end()
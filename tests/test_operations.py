@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from data.parsing import offline
+from regular_scheduling.contracts import contract_rules, rule_5, rule_6
+from regular_scheduling.operations import accepts, compact, intersection, language_hash, unfold, unfold_intersection
+
+
+@pytest.fixture(scope = "module")
+def instance8():
+    return offline("./data/Instance8")
+
+
+@pytest.mark.parametrize("rule", [rule_5, rule_6])
+@pytest.mark.parametrize("T", [10, 14, 17])
+def test_timed_rules_match_untimed(instance8, rule, T):
+    """The timed periodic and mask rules accept the same words as the materialized ones, also when the last
+    period is incomplete."""
+    for g in sorted(instance8["G"]):
+        untimed = unfold(rule(instance8, g), T)
+        timed = unfold_intersection(T, rule(instance8, g, timed = True))
+        assert language_hash(timed) == language_hash(untimed), g
+
+
+def test_timed_periodic_keeps_dead_inner_state(instance8):
+    # the weekly workload is only checked on complete weeks: the inner DFA dies in the last, incomplete one
+    word = list("OOOOOOODDD")
+    untimed = unfold(rule_6(instance8, "AA"), len(word))
+    timed = unfold_intersection(len(word), rule_6(instance8, "AA", timed = True))
+    assert accepts([word], untimed)[0] and accepts([word], timed)[0]
+
+
+def test_accepts_positions_are_earliest_per_rule():
+    """The lockstep positions are the minimum of the per-rule positions, and no earlier than the positions in the
+    intersection of the rules (with the same flags)."""
+    data = offline("./data/Instance2")
+    rules = [compact(dfa) for dfa in contract_rules(data, sorted(data["G"])[0]).values()]
+    symbols = rules[0].symbols
+    words = np.random.default_rng(0).integers(0, len(symbols), (2000, 28))
+    accepted, positions = accepts(words, *rules, symbols = symbols)
+    flags, per_rule = accepts(words, *rules, symbols = symbols, per_rule = True)
+    assert (accepted == flags.all(axis = 0)).all()
+    earliest = np.where(per_rule < 0, words.shape[1], per_rule).min(axis = 0)
+    assert (positions == np.where(accepted, -1, earliest)).all()
+    product_accepted, product_positions = accepts(words, intersection(*rules), symbols = symbols)
+    assert (product_accepted == accepted).all()
+    assert (product_positions <= positions).all()
+
+
+def test_accepts_positions_can_be_later_than_intersection():
+    # every state of each DFA is live, but no word ends with both a and b
+    ends_with = lambda s: {"alphabet": {"a", "b"}, "states": {0, 1}, "initial_state": 0, "accepting_states": {1},
+                           "transitions": {(q, c): int(c == s) for q in (0, 1) for c in "ab"}}
+    word = [list("abab")]
+    assert accepts(word, ends_with("a"), ends_with("b"))[1].tolist() == [4]
+    assert accepts(word, intersection(ends_with("a"), ends_with("b")))[1].tolist() == [0]
@@ -0,0 +1,26 @@
+import os
+import pickle
+
+from data.parsing import snapshot
+
+
+def test_snapshot_reuse(tmp_path):
+    source, path = tmp_path / "source.json", str(tmp_path / ".source.pickle")
+    source.write_text("{}")
+    builds = []
+    build = lambda: builds.append(1) or len(builds)
+    assert snapshot(source, path, build, "v1") == 1
+    assert snapshot(source, path, build, "v1") == 1
+
+    # same content with a new mtime: reused, and the header gets the new mtime
+    stat = os.stat(source)
+    os.utime(source, ns = (stat.st_atime_ns, stat.st_mtime_ns+10**9))
+    assert snapshot(source, path, build, "v1") == 1
+    with open(path, "rb") as f:
+        assert pickle.load(f)["signature"][2] == os.stat(source).st_mtime_ns
+
+    # new version of the loader or new content: rebuilt
+    assert snapshot(source, path, build, "v2") == 2
+    source.write_text("{ }")
+    assert snapshot(source, path, build, "v2") == 3
+    assert builds == [1, 1, 1]